@@ -0,0 +1,229 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from api import config
+
+
+def cache_dir() -> str:
+    """
+    Directory for Lyringo's on-disk caches. Override with LYRINGO_CACHE_DIR,
+    otherwise follows XDG (~/.cache/lyringo).
+    """
+    path = config.getenv("LYRINGO_CACHE_DIR")
+    if not path:
+        base = os.getenv("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+        path = os.path.join(base, "lyringo")
+    return path
+
+
+def normalize_text(text: str) -> str:
+    """Canonical form of a piece of text used for cache keys."""
+    text = unicodedata.normalize("NFC", text or "")
+    return " ".join(text.split())
+
+
+def make_key(*parts: str) -> str:
+    """Build a fixed-length cache key from the given parts."""
+    joined = "\x1f".join(parts)
+    return hashlib.sha1(joined.encode("utf-8")).hexdigest()
+
+
+class LRUCache:
+    """Small thread-safe in-process LRU."""
+
+    def __init__(self, maxsize: int = 4096):
+        self.maxsize = maxsize
+        self._data: "OrderedDict[str, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            if key not in self._data:
+                return None
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def set(self, key: str, value: Any):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key: str):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class SqliteCache:
+    """
+    Key/value store in a SQLite file with a TTL and a cap on the total size of
+    the stored values. When the cap is exceeded the least recently read
+    entries are evicted first.
+    """
+
+    # Check the size cap every this many writes rather than on every write.
+    EVICT_EVERY = 64
+
+    def __init__(self, path: str, table: str = "cache", ttl: Optional[float] = None, max_bytes: Optional[int] = None):
+        self.path = path
+        self.table = table
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._writes = 0
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=10, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} ("
+            "key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, "
+            "created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self._conn.execute(f"CREATE INDEX IF NOT EXISTS {table}_accessed ON {table}(accessed)")
+
+    def get(self, key: str) -> Optional[Any]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(f"SELECT value, created FROM {self.table} WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            value, created = row
+            if self.ttl is not None and now - created > self.ttl:
+                self._conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+                return None
+            self._conn.execute(f"UPDATE {self.table} SET accessed = ? WHERE key = ?", (now, key))
+            return value
+
+    def set(self, key: str, value: Any):
+        size = len(value) if isinstance(value, (str, bytes)) else 0
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, size, created, accessed) VALUES (?, ?, ?, ?, ?)",
+                (key, value, size, now, now),
+            )
+            self._writes += 1
+            if self._writes % self.EVICT_EVERY == 0:
+                self._evict()
+
+    def delete(self, key: str):
+        with self._lock:
+            self._conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute(f"DELETE FROM {self.table}")
+
+    def _evict(self):
+        if self.ttl is not None:
+            self._conn.execute(f"DELETE FROM {self.table} WHERE created < ?", (time.time() - self.ttl,))
+        if self.max_bytes is None:
+            return
+        total = self._conn.execute(f"SELECT COALESCE(SUM(size), 0) FROM {self.table}").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # Drop least recently read entries until we're back under the cap.
+        excess = total - self.max_bytes
+        freed = 0
+        doomed = []
+        for key, size in self._conn.execute(f"SELECT key, size FROM {self.table} ORDER BY accessed"):
+            doomed.append((key,))
+            freed += size
+            if freed >= excess:
+                break
+        self._conn.executemany(f"DELETE FROM {self.table} WHERE key = ?", doomed)
+
+    def evict(self):
+        """Apply the TTL and size cap now."""
+        with self._lock:
+            self._evict()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class TieredCache:
+    """
+    An in-process LRU in front of an optional SqliteCache. Disk hits are
+    promoted to memory. If the disk store can't be opened (read-only home,
+    locked file...) the cache keeps working in memory only.
+    """
+
+    def __init__(self, path: Optional[str], table: str = "cache", memory_size: int = 4096,
+                 ttl: Optional[float] = None, max_bytes: Optional[int] = None):
+        self.memory = LRUCache(memory_size)
+        self.disk: Optional[SqliteCache] = None
+        if path:
+            try:
+                self.disk = SqliteCache(path, table=table, ttl=ttl, max_bytes=max_bytes)
+            except (OSError, sqlite3.Error):
+                self.disk = None
+        self._stats_lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def _count(self, attr: str):
+        with self._stats_lock:
+            setattr(self, attr, getattr(self, attr) + 1)
+
+    def get(self, key: str) -> Optional[Any]:
+        value = self.memory.get(key)
+        if value is not None:
+            self._count("memory_hits")
+            return value
+        if self.disk is not None:
+            try:
+                value = self.disk.get(key)
+            except sqlite3.Error:
+                value = None
+            if value is not None:
+                self.memory.set(key, value)
+                self._count("disk_hits")
+                return value
+        self._count("misses")
+        return None
+
+    def set(self, key: str, value: Any):
+        self.memory.set(key, value)
+        if self.disk is not None:
+            try:
+                self.disk.set(key, value)
+            except sqlite3.Error:
+                pass
+
+    def delete(self, key: str):
+        self.memory.delete(key)
+        if self.disk is not None:
+            try:
+                self.disk.delete(key)
+            except sqlite3.Error:
+                pass
+
+    def stats(self) -> Dict[str, int]:
+        """Hit/miss counters since the cache was created."""
+        with self._stats_lock:
+            hits = self.memory_hits + self.disk_hits
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "hits": hits,
+                "misses": self.misses,
+                "memory_entries": len(self.memory),
+            }
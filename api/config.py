@@ -0,0 +1,25 @@
+import os
+import threading
+from typing import Optional
+
+_loaded = False
+_lock = threading.Lock()
+
+
+def load_env():
+    """Load the .env file once, the first time a setting is read."""
+    global _loaded
+    if _loaded:
+        return
+    with _lock:
+        if not _loaded:
+            # dotenv is only imported when a setting is actually needed
+            from dotenv import load_dotenv
+            load_dotenv()
+            _loaded = True
+
+
+def getenv(name: str, default: Optional[str] = None) -> Optional[str]:
+    """os.getenv that also sees values from the .env file."""
+    load_env()
+    return os.getenv(name, default)
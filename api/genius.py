@@ -1,11 +1,57 @@
-import lyricsgenius
+import json
 import os 
 import re
-from dotenv import load_dotenv
+import threading
+import zlib
+from typing import Optional
 
-load_dotenv()
-token = os.getenv("GENIUS_ACCESS_TOKEN")
-genius = lyricsgenius.Genius(token, verbose=False)
+from api import config, langdetect, metrics, singleflight, transport
+from api.cache import TieredCache, cache_dir, make_key, normalize_text
+from api.models import Lyrics
+
+_genius = None
+_genius_lock = threading.Lock()
+
+# Concurrent lookups of the same song (many sessions on a popular track)
+# share one search.
+_lyrics_flight = singleflight.Group("genius.get_song_lyrics")
+
+# The lyricsgenius client (and BeautifulSoup with it) is only imported and
+# built on the first lookup, which keeps startup fast.
+def client():
+    global _genius
+    with _genius_lock:
+        if _genius is None:
+            import lyricsgenius
+            token = config.getenv("GENIUS_ACCESS_TOKEN")
+            # Retries and backoff are handled by the shared transport session,
+            # so turn off lyricsgenius' own fixed sleep after every request.
+            _genius = lyricsgenius.Genius(token, verbose=False, sleep_time=0, timeout=transport.HOST_TIMEOUTS["genius.com"])
+            _genius._session = _GeniusSession(_genius._session.headers)
+        return _genius
+
+class _GeniusSession:
+    """
+    Sends lyricsgenius' requests through the shared transport session, with
+    the headers lyricsgenius set on its own session ("application:
+    LyricsGenius" and its User-Agent) added per request, so they don't leak
+    onto requests to other hosts.
+    """
+
+    def __init__(self, headers):
+        self.headers = dict(headers)
+
+    def request(self, method, url, headers=None, **kwargs):
+        merged = dict(self.headers)
+        if headers:
+            merged.update(headers)
+        return transport.session().request(method, url, headers=merged, **kwargs)
+
+# Keep `genius.genius` working for callers that used the old module global.
+def __getattr__(name):
+    if name == "genius":
+        return client()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 def clean_lyrics(lyrics):
     if not lyrics:
@@ -22,27 +68,84 @@ def clean_lyrics(lyrics):
     return lyrics.strip()
 
 
-# Look up lyrics for a given artist and song
-def get_song_lyrics(song_title, artist):
-    song = genius.search_song(song_title, artist)
+# Lyrics cache. Entries are zlib-compressed JSON, the file is capped at
+# LYRICS_CACHE_MAX_BYTES and the least recently read songs are evicted first.
+LYRICS_CACHE_TTL = 90 * 24 * 3600
+LYRICS_CACHE_MAX_BYTES = 32 * 1024 * 1024
 
-    if not song:
-        return {"formatted": None, "language": None}
-    
-    # Use the song object's metadata when available
-    title = getattr(song, "title", song_title) or song_title
-    artist_name = getattr(song, "artist", artist) or artist
-    lyrics = getattr(song, "lyrics", "") or ""
+_lyrics_cache = None
+_lyrics_cache_lock = threading.Lock()
 
-    # Clean up footer noise
-    lyrics = lyrics.strip()
-    lyrics = clean_lyrics(lyrics)
+def lyrics_cache():
+    global _lyrics_cache
+    with _lyrics_cache_lock:
+        if _lyrics_cache is None:
+            _lyrics_cache = TieredCache(
+                os.path.join(cache_dir(), "lyrics.sqlite3"),
+                table="lyrics",
+                memory_size=256,
+                ttl=LYRICS_CACHE_TTL,
+                max_bytes=LYRICS_CACHE_MAX_BYTES,
+            )
+        return _lyrics_cache
+
+def _lyrics_key(song_title, artist):
+    return make_key("lyrics", normalize_text(song_title).casefold(), normalize_text(artist).casefold())
+
+def _load_cached_lyrics(song_title, artist):
+    blob = lyrics_cache().get(_lyrics_key(song_title, artist))
+    if blob is None:
+        return None
+    try:
+        return json.loads(zlib.decompress(blob).decode("utf-8"))
+    except (zlib.error, ValueError):
+        return None
+
+def _store_cached_lyrics(song_title, artist, entry):
+    blob = zlib.compress(json.dumps(entry, ensure_ascii=False).encode("utf-8"), 6)
+    lyrics_cache().set(_lyrics_key(song_title, artist), blob)
+
+# Songs Genius had no lyrics for. Remembered for a week so we don't search
+# for them again, but not forever: lyrics do get added.
+NO_LYRICS_TTL = 7 * 24 * 3600
+
+_no_lyrics_cache = None
+
+def no_lyrics_cache():
+    global _no_lyrics_cache
+    with _lyrics_cache_lock:
+        if _no_lyrics_cache is None:
+            _no_lyrics_cache = TieredCache(
+                os.path.join(cache_dir(), "lyrics.sqlite3"),
+                table="no_lyrics",
+                memory_size=1024,
+                ttl=NO_LYRICS_TTL,
+            )
+        return _no_lyrics_cache
 
-    # Nicely formatted output
-    formatted = f"{title} — {artist_name}\n" + "-" * (len(title) + 3 + len(artist_name)) + "\n\n" + lyrics
-    # Try to extract a language field from the song object if present. The
-    # lyricsgenius Song object varies across versions; check a few likely
-    # attribute names and also inspect internal dicts if available.
+def _load_no_lyrics(song_title, artist):
+    raw = no_lyrics_cache().get(_lyrics_key(song_title, artist))
+    return json.loads(raw) if raw else None
+
+def _remember_no_lyrics(song_title, artist, title=None, artist_name=None):
+    # title/artist_name are None when the song wasn't found at all.
+    entry = {"title": title, "artist": artist_name}
+    no_lyrics_cache().set(_lyrics_key(song_title, artist), json.dumps(entry, ensure_ascii=False))
+
+def is_known_without_lyrics(song_title, artist):
+    """True if a recent lookup found no song or an empty lyrics body."""
+    return _load_no_lyrics(song_title, artist) is not None
+
+def invalidate_lyrics(song_title, artist):
+    """Forget everything cached about a song so the next lookup hits Genius."""
+    key = _lyrics_key(song_title, artist)
+    lyrics_cache().delete(key)
+    no_lyrics_cache().delete(key)
+
+# Try to extract a language field from the song object if present. The
+# lyricsgenius Song object varies across versions; check a few likely
+# attribute names and also inspect internal dicts if available.
+def _song_language(song):
     language = None
     # common attribute names on Song objects
     for attr in ("language", "primary_language", "language_code", "lyrics_language", "lang"):
@@ -83,5 +186,57 @@ def get_song_lyrics(song_title, artist):
         except Exception:
             # ignore extraction errors and leave language as None
             pass
+    return language
+
+@metrics.instrument("genius.search_song")
+def _search_song(song_title, artist):
+    return client().search_song(song_title, artist)
+
+# Look up lyrics for a given artist and song. Returns None when Genius has no
+# such song, and Lyrics without paragraphs when it has the song but no lyrics.
+def get_song_lyrics(song_title, artist) -> Optional[Lyrics]:
+    cached = _load_cached_lyrics(song_title, artist)
+    if cached:
+        return Lyrics.from_text(cached["title"], cached["artist"], cached["lyrics"], cached.get("language"))
+
+    negative = _load_no_lyrics(song_title, artist)
+    if negative:
+        # Same result as the original lookup: not found, or found without lyrics.
+        if not negative.get("title"):
+            return None
+        return Lyrics(negative["title"], negative["artist"])
+
+    return _lyrics_flight.do(_lyrics_key(song_title, artist), _fetch_song_lyrics, song_title, artist)
+
+def _fetch_song_lyrics(song_title, artist) -> Optional[Lyrics]:
+    song = _search_song(song_title, artist)
+
+    if not song:
+        _remember_no_lyrics(song_title, artist)
+        return None
+    
+    # Use the song object's metadata when available
+    title = getattr(song, "title", song_title) or song_title
+    artist_name = getattr(song, "artist", artist) or artist
+    lyrics = getattr(song, "lyrics", "") or ""
+
+    # Clean up footer noise
+    lyrics = lyrics.strip()
+    lyrics = clean_lyrics(lyrics)
+
+    # Genius often has no language for a song; then detect it from the lyrics
+    # offline, and leave it unknown rather than guess.
+    language = _song_language(song)
+    if not language and lyrics:
+        code, confidence = langdetect.detect(lyrics)
+        if confidence >= langdetect.min_confidence():
+            language = code
+
+    if lyrics:
+        _store_cached_lyrics(song_title, artist, {
+            "title": title, "artist": artist_name, "lyrics": lyrics, "language": language,
+        })
+    else:
+        _remember_no_lyrics(song_title, artist, title, artist_name)
 
-    return {"formatted": formatted, "language": language}
+    return Lyrics.from_text(title, artist_name, lyrics, language)
@@ -0,0 +1,244 @@
+import math
+import re
+import threading
+import unicodedata
+from typing import Dict, Optional, Tuple
+
+from api import config
+
+# Offline language detection, so we don't spend a translate round trip just to
+# learn what language a line is in.
+#
+# Text in a script used by (practically) one language is decided by its
+# script. Latin script text is scored with a character trigram model. The
+# model is built on first use from the compact table below: the most common
+# words of each language, most frequent first, which is close to what song
+# lyrics are made of. Whole-word hits add a bonus on top of the trigrams.
+
+_COMMON_WORDS = {
+    "en": "the you i to and a it me my of in that is be your on love all we no so for just know don't"
+          " what like can oh with this but baby when now go up out do are yeah got was will one get time"
+          " never let there they have say want way she he her his feel night heart",
+    "es": "de la que el y en a no me te los se mi un tu yo por las una con lo es para del amor más"
+          " como pero quiero si al eres sin corazón vida todo esta estoy cuando nada ya porque tú qué"
+          " soy hay bien noche siempre nunca dónde ella él ti así mañana año sueño niña señor"
+          " hasta tengo puedo fuerte calle luz tiempo mundo",
+    "fr": "de je la le et tu les des un pas que à en est une pour qui mon moi toi dans ne ma il elle"
+          " on sur mais plus au ce c'est j'ai nous vous avec me te se mes tout comme fait bien être"
+          " amour cœur jamais toujours rien encore où veux suis sais peux vie nuit soleil temps"
+          " monde ça aussi quand",
+    "de": "ich die und der du nicht das ist in mich mir dich sie es ein zu den wir mit auf was so"
+          " auch noch wie ein eine dem für nur bin hab hast wenn doch mein dein kein liebe herz immer"
+          " nie alles einfach heute nacht über will kann weiß zeit welt mehr schon gehen jetzt",
+    "it": "di e che il la non mi ti un è a per sono lo in una ma come io tu le si con se più del"
+          " della cosa questo quando anche amore cuore sei ho nel perché tutto niente sempre mai"
+          " ancora dove voglio vita notte questa anima tempo mondo occhi gli ci",
+    "pt": "de que e o a não eu é um você me do da em se te meu minha uma com para os no na por mais"
+          " as como mas quando tudo amor coração vida sem nada sou estou quero também já aqui ela"
+          " ele isso só vai noite sempre nunca saudade não mão ção tempo mundo olhar",
+    "nl": "de ik je het en een is van niet dat in op te wat me mijn jij zijn met voor die ze er maar"
+          " als we hij bij ook nog zo wel kan naar jou dan liefde hart altijd nooit alles weer nu hier"
+          " heb weet gaan laat tijd ons",
+    "sv": "och jag du att det i en på är som för inte med mig dig min din han hon vi men var så till"
+          " har de om ett kan vill när allt bara nu här av kärlek hjärta aldrig alltid natt över"
+          " tills går solen upp ut ner dansar också väg sig hem ingen",
+    "da": "og jeg du det i at en er på som til ikke med mig dig min din han hun vi men var så har de"
+          " om et kan vil når alt bare nu her af kærlighed hjerte aldrig altid nat sig"
+          " være hvad hvor også ud op ned sammen selv",
+    "no": "og jeg du det i å at en er på som til ikke med meg deg min din han hun vi men var så har de"
+          " om et kan vil når alt bare nå her av kjærlighet hjerte aldri alltid natt seg"
+          " være hva hvor også ut opp ned sammen selv",
+    "fi": "ja on ei se että minä sinä hän me te he oli ole mutta niin kun tämä kaikki vain mitä jos"
+          " nyt kuin olen olet minun sinun rakkaus sydän aina koskaan yö tänään",
+    "pl": "i w nie na się że z do to jest jak a o co mnie ty ja mi cię tak już ale po czy tylko"
+          " jestem moje miłość serce kiedy wszystko gdzie bo być noc zawsze nigdy",
+    "tr": "bir ve bu da de ne için ben sen o çok ama gibi var yok daha mi ile her şey beni seni"
+          " benim senin aşk kalp değil kadar neden gece hiç hep artık",
+    "id": "yang dan di ini itu aku kau kamu dengan untuk tidak ada dari dalam akan ke saya kita"
+          " cinta hati bisa sudah juga apa hanya selalu malam tak",
+    "ro": "și de în la nu că să cu o un pe ce mai este eu tu te mă ca din se am ai dar iubire"
+          " inima tot când pentru noapte mereu niciodată",
+    # Close relatives of es and pt, here so that they aren't taken for them.
+    "ca": "de la i que el a en no em et els es un una per amb al del com jo tu ell ella ens us meu"
+          " meva teu teva amor cor vida nit sempre mai ara aquí tot res més però quan si perquè sóc"
+          " estic vull puc vols ets és són fa molt bé dia temps món mar llum lluna cel somni t'estimo",
+    "gl": "de a o que e non se en un unha do da me te por con para os as no na eu ti meu miña teu"
+          " túa amor corazón vida noite sempre nunca agora aquí xa moito máis como pero cando todo"
+          " nada son estou quero vou ela el isto iso hai ben mar lúa ceo soño ollos",
+}
+
+# Scripts that settle the language on their own, by Unicode character name prefix.
+_SCRIPTS = (
+    ("HIRAGANA", "ja"), ("KATAKANA", "ja"), ("HANGUL", "ko"), ("CJK", "zh-CN"),
+    ("GREEK", "el"), ("HEBREW", "he"), ("ARABIC", "ar"), ("DEVANAGARI", "hi"), ("THAI", "th"),
+    ("GEORGIAN", "ka"), ("ARMENIAN", "hy"), ("BENGALI", "bn"), ("TAMIL", "ta"), ("CYRILLIC", "ru"),
+)
+
+# Cyrillic and Arabic script are shared by several languages. Only letters
+# that single out one of them settle it, checked in this order; without one
+# the script's main language is only a guess (AMBIGUOUS_SCRIPT_CONFIDENCE).
+_MARKERS = (
+    ("ru", re.compile("[ў]"), "be"),
+    ("ru", re.compile("[іїєґ]"), "uk"),
+    ("ru", re.compile("[ѓќѕ]"), "mk"),
+    ("ru", re.compile("[ђћ]"), "sr"),
+    ("ru", re.compile("[ыэё]"), "ru"),
+    ("ar", re.compile("[ٹڈڑںے]"), "ur"),
+    ("ar", re.compile("[پچژگ]"), "fa"),
+    ("ar", re.compile("[ةىأإ]"), "ar"),
+)
+_SHARED_SCRIPTS = ("ru", "ar")
+
+# Below this confidence callers should ask the network instead.
+MIN_CONFIDENCE = 0.6
+# Cyrillic text without a marker letter could be Russian, Bulgarian,
+# Serbian, Ukrainian...; Arabic script could be Arabic, Persian or Urdu.
+# Reported below MIN_CONFIDENCE so that callers ask the network.
+AMBIGUOUS_SCRIPT_CONFIDENCE = 0.5
+# How sure we must be before a lyrics line is treated as already being in the
+# player's target language (and not quizzed).
+SAME_LANGUAGE_CONFIDENCE = 0.8
+
+WORD_BONUS = 2.0
+# A trigram a language's table doesn't have falls back on how common its
+# middle letter is in that language (which tells ñ, å, ø, ß... apart).
+LETTER_BACKOFF = 0.02
+FLOOR = 1e-6
+# Scores are sums over trigrams; this tempers them into a calibrated
+# confidence instead of one that saturates after a few words.
+TEMPERATURE = 3.0
+# Below this many letters the confidence is scaled down: short lines are
+# easy to mistake.
+CONFIDENT_LETTERS = 24
+# Share of the text's trigrams the best language's table should know. Text
+# in a language the tables don't cover (Hungarian, Czech, Tagalog...) still
+# has a "best" language, but one that explains little of it; the confidence
+# is scaled down by how far the share falls short of this.
+FIT_COVERAGE = 0.5
+
+_WORD_RE = re.compile(r"[^\W\d_]+(?:'[^\W\d_]+)?")
+
+_model: Optional[Tuple[Dict[str, Dict[str, float]], Dict[str, Dict[str, float]], Dict[str, frozenset]]] = None
+_model_lock = threading.Lock()
+
+
+def _trigrams(word: str):
+    padded = f" {word} "
+    return (padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+def _load_model():
+    global _model
+    with _model_lock:
+        if _model is None:
+            trigrams = {}
+            letters = {}
+            words = {}
+            for code, table in _COMMON_WORDS.items():
+                ranked = table.split()
+                gram_counts: Dict[str, float] = {}
+                letter_counts: Dict[str, float] = {}
+                for rank, word in enumerate(ranked):
+                    # Zipf-like weight: frequent words count more.
+                    weight = 1.0 / math.sqrt(rank + 1)
+                    for gram in _trigrams(word):
+                        gram_counts[gram] = gram_counts.get(gram, 0.0) + weight
+                    for ch in word:
+                        letter_counts[ch] = letter_counts.get(ch, 0.0) + weight
+                total = sum(gram_counts.values())
+                trigrams[code] = {gram: count / total for gram, count in gram_counts.items()}
+                total = sum(letter_counts.values())
+                letters[code] = {ch: count / total for ch, count in letter_counts.items()}
+                words[code] = frozenset(ranked)
+            _model = (trigrams, letters, words)
+        return _model
+
+
+def _script_of(ch: str) -> Optional[str]:
+    if ch.isascii():
+        return "LATIN"
+    name = unicodedata.name(ch, "")
+    for prefix, code in _SCRIPTS:
+        if name.startswith(prefix):
+            return code
+    return "LATIN" if name.startswith("LATIN") else None
+
+
+def min_confidence() -> float:
+    """MIN_CONFIDENCE, or LYRINGO_DETECT_MIN_CONFIDENCE when set."""
+    try:
+        return float(config.getenv("LYRINGO_DETECT_MIN_CONFIDENCE", MIN_CONFIDENCE))
+    except ValueError:
+        return MIN_CONFIDENCE
+
+
+def detect(text: str) -> Tuple[str, float]:
+    """
+    Best guess for the language of `text` as (code, confidence), confidence
+    from 0 to 1. Returns ("unknown", 0.0) when there is nothing to go on.
+    """
+    letters = [ch for ch in (text or "").lower() if ch.isalpha()]
+    if not letters:
+        return "unknown", 0.0
+
+    scripts: Dict[str, int] = {}
+    for ch in letters:
+        script = _script_of(ch)
+        if script:
+            scripts[script] = scripts.get(script, 0) + 1
+    script, count = max(scripts.items(), key=lambda item: item[1]) if scripts else ("LATIN", 0)
+    if script != "LATIN":
+        share = count / len(letters)
+        # Japanese mixes kana with kanji; any kana means Japanese.
+        if script == "zh-CN" and scripts.get("ja"):
+            script = "ja"
+        certainty = 0.98
+        if script in _SHARED_SCRIPTS:
+            certainty = AMBIGUOUS_SCRIPT_CONFIDENCE
+            lowered = text.lower()
+            for base, pattern, code in _MARKERS:
+                if script == base and pattern.search(lowered):
+                    script, certainty = code, 0.9
+                    break
+        return script, round(share * certainty, 3)
+
+    trigrams, letter_freqs, words = _load_model()
+    scores = dict.fromkeys(trigrams, 0.0)
+    text_grams = []
+    for word in _WORD_RE.findall(text.lower()):
+        word_grams = list(_trigrams(word))
+        text_grams.extend(word_grams)
+        for code, probs in trigrams.items():
+            freqs = letter_freqs[code]
+            score = sum(math.log(probs.get(gram, 0.0) + LETTER_BACKOFF * freqs.get(gram[1], 0.0) + FLOOR)
+                        for gram in word_grams)
+            if word in words[code]:
+                score += WORD_BONUS
+            scores[code] += score
+    if not text_grams:
+        return "unknown", 0.0
+
+    best = max(scores, key=scores.get)
+    top = scores[best]
+    # Posterior of the best language, assuming equal priors, with the scores
+    # averaged per trigram and tempered.
+    scale = TEMPERATURE / math.sqrt(len(text_grams))
+    posterior = 1.0 / sum(math.exp((score - top) * scale) for score in scores.values())
+    coverage = sum(gram in trigrams[best] for gram in text_grams) / len(text_grams)
+    confidence = posterior * min(1.0, len(letters) / CONFIDENT_LETTERS) * min(1.0, coverage / FIT_COVERAGE)
+    return best, round(confidence, 3)
+
+
+def same_language(a: Optional[str], b: Optional[str]) -> bool:
+    """Compare codes loosely: zh-CN ~ zh-TW ~ zh, nb ~ no, iw ~ he."""
+    if not a or not b:
+        return False
+    aliases = {"nb": "no", "nn": "no", "iw": "he"}
+    a, b = a.lower().split("-")[0], b.lower().split("-")[0]
+    return aliases.get(a, a) == aliases.get(b, b)
+
+
+def is_language(text: str, code: str, min_confidence: float = SAME_LANGUAGE_CONFIDENCE) -> bool:
+    """True if `text` is confidently detected to be in language `code`."""
+    detected, confidence = detect(text)
+    return confidence >= min_confidence and same_language(detected, code)
@@ -0,0 +1,343 @@
+import bisect
+import threading
+import unicodedata
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+# Resolve what a player types ("english", "EN", "Español", "swed", "sweedish")
+# to a Google Translate language code. Everything is looked up in indexes
+# built once from NAMES: exact names and codes in dicts, prefixes by bisecting
+# a sorted list, and typos in a deletion index: every name is stored under
+# each string left after deleting up to MAX_TYPOS of its letters. Two words
+# within k edits share such a string, so a query only looks up its own
+# deletions and checks the few names found there, never scanning them all.
+
+# Mapping of common language names / aliases -> ISO 639-1 codes used by Google Translate.
+# Includes common names, native names and short aliases.
+NAMES = {
+    "afrikaans": "af",
+    "albanian": "sq",
+    "amharic": "am",
+    "arabic": "ar",
+    "armenian": "hy",
+    "azerbaijani": "az",
+    "basque": "eu",
+    "belarusian": "be",
+    "bengali": "bn",
+    "bosnian": "bs",
+    "bulgarian": "bg",
+    "catalan": "ca",
+    "cebuano": "ceb",
+    "chichewa": "ny",
+    "chinese": "zh-CN",
+    "chinese (simplified)": "zh-CN",
+    "chinese (traditional)": "zh-TW",
+    "croatian": "hr",
+    "czech": "cs",
+    "danish": "da",
+    "dutch": "nl",
+    "english": "en",
+    "esperanto": "eo",
+    "estonian": "et",
+    "filipino": "tl",
+    "finnish": "fi",
+    "french": "fr",
+    "galician": "gl",
+    "georgian": "ka",
+    "german": "de",
+    "greek": "el",
+    "gujarati": "gu",
+    "haitian creole": "ht",
+    "hausa": "ha",
+    "hebrew": "he",
+    "hindi": "hi",
+    "hmong": "hmn",
+    "hungarian": "hu",
+    "icelandic": "is",
+    "igbo": "ig",
+    "indonesian": "id",
+    "irish": "ga",
+    "italian": "it",
+    "japanese": "ja",
+    "javanese": "jv",
+    "kannada": "kn",
+    "kazakh": "kk",
+    "khmer": "km",
+    "korean": "ko",
+    "kurdish": "ku",
+    "kyrgyz": "ky",
+    "lao": "lo",
+    "latin": "la",
+    "latvian": "lv",
+    "lithuanian": "lt",
+    "luxembourgish": "lb",
+    "macedonian": "mk",
+    "malagasy": "mg",
+    "malay": "ms",
+    "malayalam": "ml",
+    "maltese": "mt",
+    "maori": "mi",
+    "marathi": "mr",
+    "mongolian": "mn",
+    "myanmar": "my",
+    "nepali": "ne",
+    "norwegian": "no",
+    "odia": "or",
+    "pashto": "ps",
+    "persian": "fa",
+    "polish": "pl",
+    "portuguese": "pt",
+    "punjabi": "pa",
+    "romanian": "ro",
+    "russian": "ru",
+    "scots gaelic": "gd",
+    "serbian": "sr",
+    "sesotho": "st",
+    "shona": "sn",
+    "sindhi": "sd",
+    "sinhala": "si",
+    "slovak": "sk",
+    "slovenian": "sl",
+    "somali": "so",
+    "spanish": "es",
+    "sundanese": "su",
+    "swahili": "sw",
+    "swedish": "sv",
+    "tajik": "tg",
+    "tamil": "ta",
+    "telugu": "te",
+    "thai": "th",
+    "turkish": "tr",
+    "ukrainian": "uk",
+    "urdu": "ur",
+    "uyghur": "ug",
+    "uzbek": "uz",
+    "vietnamese": "vi",
+    "welsh": "cy",
+    "xhosa": "xh",
+    "yiddish": "yi",
+    "yoruba": "yo",
+    "zulu": "zu",
+    # common short aliases and native names
+    "svenska": "sv",
+    "español": "es",
+    "deutsch": "de",
+    "français": "fr",
+    "italiano": "it",
+    "português": "pt",
+    "русский": "ru",
+    "中文": "zh-CN",
+    "日本語": "ja",
+    "한국어": "ko",
+    "nb": "no",  # norwegian bokmål alias
+    "zh": "zh-CN",
+}
+
+
+# Ranking of the ways a candidate can match, best first.
+EXACT = "exact"
+CODE = "code"
+PREFIX = "prefix"
+TYPO = "typo"
+_RANK = {EXACT: 0, CODE: 0, PREFIX: 1, TYPO: 2}
+
+
+class Candidate(NamedTuple):
+    code: str
+    name: str
+    match: str
+    # Edits between the query and `name` for typo matches, else 0.
+    distance: int = 0
+
+
+def _fold(text: str) -> str:
+    """Case- and accent-insensitive form: "Français (Canada)" -> "francais canada"."""
+    text = text.casefold()
+    if not text.isascii():
+        decomposed = unicodedata.normalize("NFD", text)
+        text = unicodedata.normalize("NFC", "".join(ch for ch in decomposed if unicodedata.category(ch) != "Mn"))
+    return " ".join("".join(ch if ch.isalnum() else " " for ch in text).split())
+
+
+def _edit_distance(a: str, b: str) -> int:
+    """Levenshtein distance."""
+    # A typo leaves most of the word alone; only the middle needs the table.
+    start = 0
+    while start < len(a) and start < len(b) and a[start] == b[start]:
+        start += 1
+    end = 0
+    while end < len(a) - start and end < len(b) - start and a[-1 - end] == b[-1 - end]:
+        end += 1
+    a, b = a[start:len(a) - end], b[start:len(b) - end]
+    if len(a) < len(b):
+        a, b = b, a
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+        previous = current
+    return previous[-1]
+
+
+MAX_TYPOS = 2
+
+
+def _max_typos(query: str) -> int:
+    """Edits tolerated for a query of this length."""
+    if len(query) < 4:
+        return 0
+    return 1 if len(query) < 7 else MAX_TYPOS
+
+
+def _deletions(word: str, depth: int) -> set:
+    """`word` and every string left after deleting up to `depth` of its characters."""
+    found = {word}
+    frontier = {word}
+    for _ in range(depth):
+        frontier = {w[:i] + w[i + 1:] for w in frontier for i in range(len(w))}
+        found |= frontier
+    return found
+
+
+class _Index:
+    def __init__(self, names: Dict[str, str]):
+        # folded name -> (code, name as listed)
+        self.names: Dict[str, Tuple[str, str]] = {}
+        # lower-case code -> code as Google spells it ("zh-cn" -> "zh-CN")
+        self.codes: Dict[str, str] = {}
+        # code -> display name: the first plain ASCII name listed, else the first name
+        self.display: Dict[str, str] = {}
+        prefixes = set()
+        # deletion -> folded names it was made from
+        self.deletions: Dict[str, List[str]] = {}
+        for name, code in names.items():
+            folded = _fold(name)
+            self.names.setdefault(folded, (code, name))
+            self.codes.setdefault(code.lower(), code)
+            if code not in self.display or (not self.display[code].isascii() and name.isascii()):
+                self.display[code] = name
+            # Every word is a way in: "trad" finds "chinese (traditional)".
+            words = folded.split()
+            for i in range(len(words)):
+                prefixes.add((" ".join(words[i:]), folded))
+            if self.names[folded][1] == name:  # once per distinct folded name
+                for deletion in _deletions(folded, MAX_TYPOS):
+                    self.deletions.setdefault(deletion, []).append(folded)
+        # (term, folded name), sorted so all terms sharing a prefix are adjacent.
+        self.prefixes: List[Tuple[str, str]] = sorted(prefixes)
+
+
+_index: Optional[_Index] = None
+_index_lock = threading.Lock()
+
+
+def _get_index() -> _Index:
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = _Index(NAMES)
+    return _index
+
+
+def resolve(query: str, limit: int = 5) -> List[Candidate]:
+    """
+    Ranked candidates for `query`, best first and one per language: exact
+    names and codes, then names starting with it (shortest first), then, only
+    if nothing matched so far, names within a few typos (closest first).
+    """
+    index = _get_index()
+    folded = _fold(query or "")
+    if not folded:
+        return []
+    best: Dict[str, Candidate] = {}
+
+    def add(candidate: Candidate):
+        current = best.get(candidate.code)
+        if current is None or _order(candidate) < _order(current):
+            best[candidate.code] = candidate
+
+    code = index.codes.get(query.strip().lower())
+    if code:
+        add(Candidate(code, index.display[code], CODE))
+    if folded in index.names:
+        code, name = index.names[folded]
+        add(Candidate(code, name, EXACT))
+    at = bisect.bisect_left(index.prefixes, (folded,))
+    while at < len(index.prefixes) and index.prefixes[at][0].startswith(folded):
+        code, name = index.names[index.prefixes[at][1]]
+        add(Candidate(code, name, PREFIX))
+        at += 1
+    if not best:
+        limit_typos = _max_typos(folded)
+        checked = set()
+        for deletion in _deletions(folded, limit_typos):
+            for match in index.deletions.get(deletion, ()):
+                if match in checked:
+                    continue
+                checked.add(match)
+                distance = _edit_distance(folded, match)
+                if distance <= limit_typos:
+                    code, name = index.names[match]
+                    add(Candidate(code, name, TYPO, distance))
+    return sorted(best.values(), key=_order)[:limit]
+
+
+def _order(candidate: Candidate):
+    return _RANK[candidate.match], candidate.distance, len(candidate.name), candidate.name
+
+
+def lookup(query: str) -> Optional[str]:
+    """
+    The code `query` stands for, or None when it is unknown or ambiguous
+    ("chi" could be chichewa or chinese). Two letters that aren't a known
+    name or code are taken as a code anyway, since Google supports more
+    languages than NAMES lists.
+    """
+    # Most input is a plain name or code; those need no folding or ranking.
+    index = _get_index()
+    s = (query or "").strip().lower()
+    if s in index.codes:
+        return index.codes[s]
+    if s in index.names:
+        return index.names[s][0]
+    candidates = resolve(query, limit=len(NAMES))
+    if candidates and candidates[0].match in (EXACT, CODE):
+        return candidates[0].code
+    if len(s) == 2 and s.isalpha():
+        return s
+    if not candidates:
+        return None
+    # Unambiguous only if every equally good candidate means the same language.
+    top = candidates[0]
+    tied = {c.code for c in candidates if (_RANK[c.match], c.distance) == (_RANK[top.match], top.distance)}
+    return top.code if len(tied) == 1 else None
+
+
+def display_name(code: str) -> str:
+    """Human-friendly name for a code ("sv" -> "swedish"); the code itself when unknown."""
+    index = _get_index()
+    canonical = index.codes.get(code.lower(), code)
+    return index.display.get(canonical, code).lower()
+
+
+def parse_list(value: str) -> List[str]:
+    """
+    Codes for a comma separated list of names or codes ("english,sv"), as
+    an argparse `type=` for --languages options. Unknown names and an empty
+    list raise argparse.ArgumentTypeError.
+    """
+    import argparse
+
+    codes = []
+    for name in value.split(","):
+        name = name.strip()
+        if not name:
+            continue
+        code = lookup(name)
+        if not code:
+            raise argparse.ArgumentTypeError(f"unknown language {name!r}")
+        codes.append(code)
+    if not codes:
+        raise argparse.ArgumentTypeError("no languages given")
+    return codes
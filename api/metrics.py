@@ -0,0 +1,243 @@
+import atexit
+import functools
+import json
+import sys
+import threading
+import time
+from typing import Dict, List, Optional
+
+from api import config, tracing
+
+# Latency histogram bucket upper bounds, in seconds.
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, float("inf"))
+
+FORMATS = ("summary", "json", "prometheus")
+
+# Checked before doing any work so that disabled metrics cost one global read.
+_enabled = False
+_format = "summary"
+_path: Optional[str] = None
+_lock = threading.Lock()
+_stats: Dict[str, "EndpointStats"] = {}
+# Single-flight groups: calls made, and how many of them shared another
+# caller's request instead of sending their own (api.singleflight).
+_coalesced: Dict[str, List[int]] = {}
+_atexit_registered = False
+
+
+class EndpointStats:
+    __slots__ = ("calls", "errors", "bytes", "latency_sum", "latency_max", "buckets")
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.bytes = 0
+        self.latency_sum = 0.0
+        self.latency_max = 0.0
+        self.buckets = [0] * len(BUCKETS)
+
+    def add(self, seconds: float, error: bool, nbytes: int):
+        self.calls += 1
+        self.errors += error
+        self.bytes += nbytes
+        self.latency_sum += seconds
+        self.latency_max = max(self.latency_max, seconds)
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                self.buckets[i] += 1
+                break
+
+    def quantile(self, q: float) -> float:
+        """Estimate a latency quantile from the histogram (upper bucket bound)."""
+        if not self.calls:
+            return 0.0
+        rank = q * self.calls
+        seen = 0
+        for bound, count in zip(BUCKETS, self.buckets):
+            seen += count
+            if seen >= rank:
+                return self.latency_max if bound == float("inf") else min(bound, self.latency_max)
+        return self.latency_max
+
+    def as_dict(self) -> dict:
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "bytes": self.bytes,
+            "latency_sum": self.latency_sum,
+            "latency_max": self.latency_max,
+            "latency_p50": self.quantile(0.5),
+            "latency_p90": self.quantile(0.9),
+            "latency_p99": self.quantile(0.99),
+            "buckets": {("+Inf" if b == float("inf") else str(b)): c for b, c in zip(BUCKETS, self.buckets)},
+        }
+
+
+def enabled() -> bool:
+    return _enabled
+
+
+def enable(fmt: str = "summary", path: Optional[str] = None, at_exit: bool = True):
+    """
+    Start recording. When `at_exit` is set the report is written on exit, to
+    `path` or to stderr, in one of FORMATS.
+    """
+    global _enabled, _format, _path, _atexit_registered
+    if fmt not in FORMATS:
+        raise ValueError(f"unknown metrics format {fmt!r}, expected one of {', '.join(FORMATS)}")
+    _format, _path = fmt, path
+    _enabled = True
+    if at_exit and not _atexit_registered:
+        atexit.register(dump)
+        _atexit_registered = True
+
+
+def enable_from_env():
+    """
+    Enable metrics if LYRINGO_METRICS is set: "1"/"summary", "json" or
+    "prometheus". LYRINGO_METRICS_FILE writes the report to a file.
+    """
+    value = (config.getenv("LYRINGO_METRICS") or "").strip().lower()
+    if not value or value in ("0", "false", "off"):
+        return
+    enable("summary" if value in ("1", "true", "on") else value, config.getenv("LYRINGO_METRICS_FILE"))
+
+
+def disable():
+    global _enabled
+    _enabled = False
+
+
+def reset():
+    with _lock:
+        _stats.clear()
+        _coalesced.clear()
+
+
+def record(endpoint: str, seconds: float, error: bool = False, nbytes: int = 0):
+    if not _enabled:
+        return
+    with _lock:
+        stats = _stats.get(endpoint)
+        if stats is None:
+            stats = _stats[endpoint] = EndpointStats()
+        stats.add(seconds, error, nbytes)
+
+
+def record_coalesced(group: str, shared: bool):
+    if not _enabled:
+        return
+    with _lock:
+        counts = _coalesced.get(group)
+        if counts is None:
+            counts = _coalesced[group] = [0, 0]
+        counts[0] += 1
+        counts[1] += shared
+
+
+def instrument(endpoint: str):
+    """
+    Decorator recording the latency and failures of every call, and a span
+    in the session trace when tracing is on.
+    """
+
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not (_enabled or tracing.enabled()):
+                return fn(*args, **kwargs)
+            start = time.perf_counter()
+            error = True
+            try:
+                result = fn(*args, **kwargs)
+                error = False
+                return result
+            finally:
+                end = time.perf_counter()
+                record(endpoint, end - start, error=error)
+                if error:
+                    tracing.add_span(endpoint, start, end, cat="upstream", error=True)
+                else:
+                    tracing.add_span(endpoint, start, end, cat="upstream")
+
+        return wrapper
+
+    return decorator
+
+
+def snapshot() -> Dict[str, dict]:
+    with _lock:
+        return {name: stats.as_dict() for name, stats in sorted(_stats.items())}
+
+
+def coalescing_snapshot() -> Dict[str, dict]:
+    """Per single-flight group: calls, shared (served by another caller's request) and their rate."""
+    with _lock:
+        return {
+            group: {"calls": calls, "shared": shared, "rate": shared / calls if calls else 0.0}
+            for group, (calls, shared) in sorted(_coalesced.items())
+        }
+
+
+def _render_summary(data: Dict[str, dict], coalescing: Dict[str, dict]) -> str:
+    lines = [f"{'endpoint':<40} {'calls':>6} {'errors':>6} {'KiB':>8} {'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8} {'max ms':>8}"]
+    for name, s in data.items():
+        lines.append(
+            f"{name:<40} {s['calls']:>6} {s['errors']:>6} {s['bytes'] / 1024:>8.1f} "
+            f"{s['latency_p50'] * 1000:>8.1f} {s['latency_p90'] * 1000:>8.1f} "
+            f"{s['latency_p99'] * 1000:>8.1f} {s['latency_max'] * 1000:>8.1f}"
+        )
+    if coalescing:
+        lines.append("")
+        lines.append(f"{'coalesced':<40} {'calls':>6} {'shared':>6} {'rate':>8}")
+        for group, c in coalescing.items():
+            lines.append(f"{group:<40} {c['calls']:>6} {c['shared']:>6} {c['rate'] * 100:>7.1f}%")
+    return "\n".join(lines) + "\n"
+
+
+def _label(name: str, value: str) -> str:
+    return name + '="' + value.replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+def _render_prometheus(data: Dict[str, dict], coalescing: Dict[str, dict]) -> str:
+    # One metric family at a time: its TYPE line, then all of its samples.
+    out: List[str] = []
+    endpoints = [(_label("endpoint", name), s) for name, s in data.items()]
+    for family, field in (("lyringo_upstream_calls_total", "calls"), ("lyringo_upstream_errors_total", "errors"),
+                          ("lyringo_upstream_bytes_total", "bytes")):
+        out.append(f"# TYPE {family} counter")
+        out.extend(f"{family}{{{label}}} {s[field]}" for label, s in endpoints)
+    out.append("# TYPE lyringo_upstream_latency_seconds histogram")
+    for label, s in endpoints:
+        cumulative = 0
+        for bound, count in s["buckets"].items():
+            cumulative += count
+            out.append(f'lyringo_upstream_latency_seconds_bucket{{{label},le="{bound}"}} {cumulative}')
+        out.append(f"lyringo_upstream_latency_seconds_sum{{{label}}} {s['latency_sum']}")
+        out.append(f"lyringo_upstream_latency_seconds_count{{{label}}} {s['calls']}")
+    groups = [(_label("group", group), c) for group, c in coalescing.items()]
+    for family, field in (("lyringo_coalesced_calls_total", "calls"), ("lyringo_coalesced_shared_total", "shared")):
+        out.append(f"# TYPE {family} counter")
+        out.extend(f"{family}{{{label}}} {c[field]}" for label, c in groups)
+    return "\n".join(out) + "\n"
+
+
+def render(fmt: str = "summary") -> str:
+    data, coalescing = snapshot(), coalescing_snapshot()
+    if fmt == "json":
+        return json.dumps({"endpoints": data, "coalescing": coalescing}, indent=2) + "\n"
+    if fmt == "prometheus":
+        return _render_prometheus(data, coalescing)
+    return _render_summary(data, coalescing)
+
+
+def dump():
+    """Write the report in the configured format and destination."""
+    if not _enabled:
+        return
+    text = render(_format)
+    if _path:
+        with open(_path, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        sys.stderr.write("\n" + text)
@@ -0,0 +1,90 @@
+from typing import Optional, Tuple
+
+# Plain __slots__ classes rather than dataclasses: importing dataclasses (and
+# inspect with it) would add ~10 ms to every start.
+
+
+class _Record:
+    """Immutable slotted record with value equality and a readable repr."""
+    __slots__ = ()
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def _fields(self):
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    def __eq__(self, other):
+        if type(other) is not type(self):
+            return NotImplemented
+        return self._fields() == other._fields()
+
+    def __hash__(self):
+        return hash(self._fields())
+
+    def __repr__(self):
+        args = ", ".join(f"{name}={getattr(self, name)!r}" for name in self.__slots__)
+        return f"{type(self).__name__}({args})"
+
+
+class Song(_Record):
+    """A track to play, as listed in a playlist or typed in by the player."""
+    __slots__ = ("title", "artists")
+
+    def __init__(self, title: str, artists: Tuple[str, ...] = ()):
+        object.__setattr__(self, "title", title)
+        object.__setattr__(self, "artists", tuple(artists))
+
+    @property
+    def artist(self) -> str:
+        """The primary artist, "" when unknown. Used for lyrics searches."""
+        return self.artists[0] if self.artists else ""
+
+
+def split_paragraphs(text: str) -> Tuple[Tuple[str, ...], ...]:
+    """
+    Split a lyrics body into paragraphs (separated by blank lines), each a
+    tuple of its stripped, non-empty lines.
+    """
+    paragraphs = []
+    lines = []
+    for line in (text or "").splitlines():
+        line = line.strip()
+        if line:
+            lines.append(line)
+        elif lines:
+            paragraphs.append(tuple(lines))
+            lines = []
+    if lines:
+        paragraphs.append(tuple(lines))
+    return tuple(paragraphs)
+
+
+class Lyrics(_Record):
+    """
+    The lyrics of one song, split once into paragraphs of lines. `lines` is
+    every line in order, so a line's index is stable for the whole game.
+    Found-but-empty lyrics have no paragraphs.
+    """
+    __slots__ = ("title", "artist", "paragraphs", "language", "lines")
+
+    def __init__(self, title: str, artist: str, paragraphs: Tuple[Tuple[str, ...], ...] = (),
+                 language: Optional[str] = None):
+        paragraphs = tuple(tuple(paragraph) for paragraph in paragraphs)
+        object.__setattr__(self, "title", title)
+        object.__setattr__(self, "artist", artist)
+        object.__setattr__(self, "paragraphs", paragraphs)
+        object.__setattr__(self, "language", language)
+        object.__setattr__(self, "lines", tuple(line for paragraph in paragraphs for line in paragraph))
+
+    @classmethod
+    def from_text(cls, title: str, artist: str, text: str, language: Optional[str] = None) -> "Lyrics":
+        return cls(title, artist, split_paragraphs(text), language)
+
+    @property
+    def has_lyrics(self) -> bool:
+        return bool(self.paragraphs)
+
+    def text(self) -> str:
+        """The lyrics body, paragraphs separated by a blank line."""
+        return "\n\n".join("\n".join(paragraph) for paragraph in self.paragraphs)
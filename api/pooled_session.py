@@ -0,0 +1,83 @@
+import time
+from typing import TYPE_CHECKING, Optional
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from api import metrics
+from api.transport import DEFAULT_POOL_SIZE, MAX_RETRIES, RETRY_STATUSES, backoff_delay, timeout_for
+
+if TYPE_CHECKING:
+    from api.ratelimit import HostLimiter
+
+
+class PooledSession(requests.Session):
+    """
+    requests.Session with a sized keep-alive pool, per-host default timeouts
+    and retries with backoff on 429/5xx responses, timeouts and dropped
+    connections. After the last retry the final response is returned (or the
+    final exception raised) so callers handle errors as before.
+
+    Pass `limiter` (an api.ratelimit.HostLimiter) to pace every attempt; a
+    429 answer counts as a throttle.
+    """
+
+    def __init__(self, pool_size: int = DEFAULT_POOL_SIZE, max_retries: int = MAX_RETRIES):
+        super().__init__()
+        self.max_retries = max_retries
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.mount("https://", adapter)
+        self.mount("http://", adapter)
+        self.headers["User-Agent"] = f"Lyringo {requests.utils.default_user_agent()}"
+
+    def request(self, method, url, *args, retries: Optional[int] = None, limiter: Optional["HostLimiter"] = None,
+                **kwargs):
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = timeout_for(url)
+        retries = self.max_retries if retries is None else retries
+        attempt = 0
+        while True:
+            try:
+                if limiter is None:
+                    response = self._send(method, url, *args, **kwargs)
+                else:
+                    response = self._send_limited(limiter, method, url, *args, **kwargs)
+            except (requests.exceptions.Timeout, requests.exceptions.ConnectionError):
+                if attempt >= retries:
+                    raise
+                attempt += 1
+                time.sleep(backoff_delay(attempt))
+                continue
+            if response.status_code in RETRY_STATUSES and attempt < retries:
+                attempt += 1
+                delay = backoff_delay(attempt, response.headers.get("Retry-After"))
+                response.close()
+                time.sleep(delay)
+                continue
+            return response
+
+    def _send_limited(self, limiter: "HostLimiter", method, url, *args, **kwargs):
+        permit = limiter.acquire()
+        outcome = "error"
+        try:
+            response = self._send(method, url, *args, **kwargs)
+            outcome = "throttled" if response.status_code == 429 else "ok"
+            return response
+        finally:
+            limiter.release(permit, outcome)
+
+    def _send(self, method, url, *args, **kwargs):
+        # One attempt, recorded per host when metrics are on.
+        if not metrics.enabled():
+            return super().request(method, url, *args, **kwargs)
+        endpoint = f"http {method} {urlsplit(url).hostname}"
+        start = time.perf_counter()
+        try:
+            response = super().request(method, url, *args, **kwargs)
+        except Exception:
+            metrics.record(endpoint, time.perf_counter() - start, error=True)
+            raise
+        metrics.record(endpoint, time.perf_counter() - start,
+                       error=response.status_code >= 400, nbytes=len(response.content or b""))
+        return response
@@ -0,0 +1,157 @@
+import threading
+import time
+from typing import Dict, Optional
+
+from api import metrics, tracing
+
+# Client-side pacing per upstream host, for upstreams that ban clients that
+# send too much (the Google Translate gtx endpoint). Two limits apply:
+#
+# - a token bucket caps the request rate, with some burst allowance;
+# - an AIMD limit caps the requests in flight: it grows by one per window of
+#   successful requests (additive increase) and halves when the host says we
+#   are going too fast (multiplicative decrease), the way TCP finds its
+#   congestion window.
+#
+# Prefetch workers and bulk jobs can then ask as fast as they like; the
+# limiter settles just below the rate the host tolerates.
+
+# Multiplicative decrease applied to the concurrency limit on a throttle.
+DECREASE_FACTOR = 0.5
+# After a throttle the bucket is emptied and stays empty this long, so the
+# requests already queued don't all hit the host again at once.
+THROTTLE_PAUSE = 1.0
+
+
+class TokenBucket:
+    """`rate` tokens per second, at most `burst` saved up. A rate of 0 means no limit."""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._updated = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Take one token, sleeping until there is one."""
+        if self.rate <= 0:
+            return
+        with self._lock:
+            now = time.perf_counter()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            # Reserve the token now (possibly going negative) and sleep off
+            # the debt outside the lock, so waiters are served in order.
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+        if wait:
+            time.sleep(wait)
+
+    def pause(self, seconds: float):
+        """Hand out no tokens for `seconds` from now."""
+        if self.rate <= 0:
+            return
+        with self._lock:
+            now = time.perf_counter()
+            self._tokens = min(self._tokens + (now - self._updated) * self.rate, 0.0) - seconds * self.rate
+            self._updated = now
+
+
+class Permit:
+    """One request's slot, from HostLimiter.acquire()."""
+    __slots__ = ("granted", "waited")
+
+    def __init__(self, granted: float, waited: float):
+        self.granted = granted
+        self.waited = waited
+
+
+class HostLimiter:
+    """
+    Rate and adaptive concurrency limit for one upstream host. Every request
+    takes a permit with `acquire()` and hands it back with `release()`,
+    saying whether the host throttled it.
+    """
+
+    def __init__(self, host: str, rate: float, burst: int, max_concurrency: int,
+                 initial_concurrency: Optional[int] = None, min_concurrency: int = 1):
+        self.host = host
+        self.bucket = TokenBucket(rate, burst)
+        self.min_concurrency = max(1, min_concurrency)
+        self.max_concurrency = max(self.min_concurrency, max_concurrency)
+        initial = initial_concurrency or self.max_concurrency
+        self.limit = float(min(self.max_concurrency, max(self.min_concurrency, initial)))
+        self.in_flight = 0
+        self.throttles = 0
+        self._decreased = 0.0
+        self._cond = threading.Condition()
+        self._endpoint = f"ratelimit {host}"
+
+    def acquire(self) -> Permit:
+        """Wait for a free slot and a token."""
+        start = time.perf_counter()
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                self._cond.wait()
+            self.in_flight += 1
+        try:
+            self.bucket.acquire()
+        except BaseException:
+            self._release_slot()
+            raise
+        granted = time.perf_counter()
+        if granted - start > 0.001:
+            tracing.add_span(self._endpoint, start, granted, cat="wait")
+        return Permit(granted, granted - start)
+
+    def release(self, permit: Permit, outcome: str = "ok"):
+        """
+        Hand back a permit. `outcome` is "ok" (the host answered), "throttled"
+        (it asked us to slow down) or "error" (no answer; says nothing about
+        the rate).
+        """
+        if outcome == "throttled":
+            self.throttled(permit.granted)
+        elif outcome == "ok":
+            with self._cond:
+                # +1 per `limit` successes: one more slot per window of requests.
+                self.limit = min(self.max_concurrency, self.limit + 1.0 / self.limit)
+        self._release_slot()
+        metrics.record(self._endpoint, permit.waited, error=outcome == "throttled")
+
+    def throttled(self, since: float):
+        """
+        The host throttled a request sent at `since` (a time.perf_counter()
+        value). Requests sent before the last decrease don't count again:
+        they went out under the old limit.
+        """
+        with self._cond:
+            self.throttles += 1
+            if since < self._decreased:
+                return
+            self.limit = max(self.min_concurrency, self.limit * DECREASE_FACTOR)
+            self._decreased = time.perf_counter()
+        self.bucket.pause(THROTTLE_PAUSE)
+
+    def _release_slot(self):
+        with self._cond:
+            self.in_flight -= 1
+            self._cond.notify()
+
+    def stats(self) -> Dict[str, float]:
+        with self._cond:
+            return {"limit": self.limit, "in_flight": self.in_flight, "throttles": self.throttles}
+
+
+_limiters: Dict[str, HostLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def limiter(host: str, rate: float, burst: int, max_concurrency: int, **kwargs) -> HostLimiter:
+    """The process-wide limiter of `host`, created with these settings on first use."""
+    with _limiters_lock:
+        found = _limiters.get(host)
+        if found is None:
+            found = _limiters[host] = HostLimiter(host, rate, burst, max_concurrency, **kwargs)
+        return found
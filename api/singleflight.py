@@ -0,0 +1,69 @@
+import threading
+from typing import Any, Callable, Dict, Hashable
+
+from api import metrics
+
+# Coalescing of identical concurrent upstream calls. With several game
+# sessions and translate-ahead workers running, the same song, playlist or
+# paragraph is often asked for by many threads at the same moment (a popular
+# song, a shared chorus). Only the first caller goes upstream; the others
+# wait for it and get its result, or its error. Nothing is kept once the call
+# finishes: remembering results is the caches' job.
+
+
+# Result of a call whose leader was interrupted (KeyboardInterrupt, exit):
+# waiters then make the call themselves instead of inheriting the interrupt.
+_INTERRUPTED = object()
+
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = _INTERRUPTED
+        self.error = None
+
+
+class Group:
+    """
+    Calls in flight, by key. `do(key, fn, ...)` runs fn unless a call with
+    the same key is already running, in which case it waits for that one.
+    Callers sharing a result get the same object, so treat it as read-only.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+
+    def do(self, key: Hashable, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        metrics.record_coalesced(self.name, shared=not leader)
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            if call.result is _INTERRUPTED:
+                return self.do(key, fn, *args, **kwargs)
+            return call.result
+
+        try:
+            call.result = fn(*args, **kwargs)
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls)
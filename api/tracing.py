@@ -0,0 +1,111 @@
+import atexit
+import contextlib
+import json
+import os
+import threading
+import time
+from typing import List, Optional
+
+from api import config
+
+# Trace events are collected in memory and written as Chrome trace-event JSON
+# (open in Perfetto or chrome://tracing). Checked before doing any work so
+# that disabled tracing costs one global read.
+_enabled = False
+_path: Optional[str] = None
+_lock = threading.Lock()
+_events: List[dict] = []
+_local = threading.local()
+_next_tid = 1
+_atexit_registered = False
+_epoch = time.perf_counter()
+
+
+def enabled() -> bool:
+    return _enabled
+
+
+def enable(path: str, at_exit: bool = True):
+    """Start recording; the trace is written to `path` on exit (or by write())."""
+    global _enabled, _path, _atexit_registered
+    _path = path
+    _enabled = True
+    if at_exit and not _atexit_registered:
+        atexit.register(write)
+        _atexit_registered = True
+
+
+def enable_from_env():
+    """Enable tracing if LYRINGO_TRACE is set to an output file path."""
+    path = config.getenv("LYRINGO_TRACE")
+    if path:
+        enable(path)
+
+
+def _us(t: float) -> float:
+    return round((t - _epoch) * 1e6, 1)
+
+
+def _tid() -> int:
+    # Small ids per thread, with a name event so Perfetto labels them. Kept in
+    # a thread local because OS thread idents are reused once a thread exits.
+    global _next_tid
+    tid = getattr(_local, "tid", None)
+    if tid is None:
+        tid = _local.tid = _next_tid
+        _next_tid += 1
+        _events.append({
+            "name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": tid,
+            "args": {"name": threading.current_thread().name},
+        })
+    return tid
+
+
+def add_span(name: str, start: float, end: float, cat: str = "phase", **args):
+    """Record a completed span; start/end are time.perf_counter() values."""
+    if not _enabled:
+        return
+    with _lock:
+        event = {"name": name, "cat": cat, "ph": "X", "ts": _us(start), "dur": round((end - start) * 1e6, 1),
+                 "pid": os.getpid(), "tid": _tid()}
+        if args:
+            event["args"] = args
+        _events.append(event)
+
+
+@contextlib.contextmanager
+def span(name: str, cat: str = "phase", **args):
+    """Time the enclosed block as one span. Use cat="user" for time spent waiting on the player."""
+    if not _enabled:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        add_span(name, start, time.perf_counter(), cat, **args)
+
+
+def instant(name: str, cat: str = "phase", **args):
+    if not _enabled:
+        return
+    with _lock:
+        event = {"name": name, "cat": cat, "ph": "i", "s": "t", "ts": _us(time.perf_counter()),
+                 "pid": os.getpid(), "tid": _tid()}
+        if args:
+            event["args"] = args
+        _events.append(event)
+
+
+def events() -> List[dict]:
+    with _lock:
+        return list(_events)
+
+
+def write(path: Optional[str] = None):
+    """Write the collected events as a Chrome trace-event JSON file."""
+    path = path or _path
+    if not (_enabled and path):
+        return
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"traceEvents": events(), "displayTimeUnit": "ms"}, f)
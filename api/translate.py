@@ -1,133 +1,43 @@
 # ...existing code...
-import re
-from typing import Tuple, Optional, List
-import requests
+import os
+import threading
+import time
+from urllib.parse import quote
+from typing import Dict, Optional, List
+
+from api import config, langdetect, languages, metrics, ratelimit, singleflight, transport
+from api.cache import TieredCache, cache_dir, make_key, normalize_text
+from api.models import Lyrics
 
 GOOGLE_TRANSLATE_URL = "https://translate.googleapis.com/translate_a/single"
 
-# Mapping of common language names / aliases -> ISO 639-1 codes used by Google Translate.
-# Includes common names, native names and short aliases.
-_LANG_NAME_TO_CODE = {
-    "afrikaans": "af",
-    "albanian": "sq",
-    "amharic": "am",
-    "arabic": "ar",
-    "armenian": "hy",
-    "azerbaijani": "az",
-    "basque": "eu",
-    "belarusian": "be",
-    "bengali": "bn",
-    "bosnian": "bs",
-    "bulgarian": "bg",
-    "catalan": "ca",
-    "cebuano": "ceb",
-    "chichewa": "ny",
-    "chinese": "zh-CN",
-    "chinese (simplified)": "zh-CN",
-    "chinese (traditional)": "zh-TW",
-    "croatian": "hr",
-    "czech": "cs",
-    "danish": "da",
-    "dutch": "nl",
-    "english": "en",
-    "esperanto": "eo",
-    "estonian": "et",
-    "filipino": "tl",
-    "finnish": "fi",
-    "french": "fr",
-    "galician": "gl",
-    "georgian": "ka",
-    "german": "de",
-    "greek": "el",
-    "gujarati": "gu",
-    "haitian creole": "ht",
-    "hausa": "ha",
-    "hebrew": "he",
-    "hindi": "hi",
-    "hmong": "hmn",
-    "hungarian": "hu",
-    "icelandic": "is",
-    "igbo": "ig",
-    "indonesian": "id",
-    "irish": "ga",
-    "italian": "it",
-    "japanese": "ja",
-    "javanese": "jv",
-    "kannada": "kn",
-    "kazakh": "kk",
-    "khmer": "km",
-    "korean": "ko",
-    "kurdish": "ku",
-    "kyrgyz": "ky",
-    "lao": "lo",
-    "latin": "la",
-    "latvian": "lv",
-    "lithuanian": "lt",
-    "luxembourgish": "lb",
-    "macedonian": "mk",
-    "malagasy": "mg",
-    "malay": "ms",
-    "malayalam": "ml",
-    "maltese": "mt",
-    "maori": "mi",
-    "marathi": "mr",
-    "mongolian": "mn",
-    "myanmar": "my",
-    "nepali": "ne",
-    "norwegian": "no",
-    "odia": "or",
-    "pashto": "ps",
-    "persian": "fa",
-    "polish": "pl",
-    "portuguese": "pt",
-    "punjabi": "pa",
-    "romanian": "ro",
-    "russian": "ru",
-    "scots gaelic": "gd",
-    "serbian": "sr",
-    "sesotho": "st",
-    "shona": "sn",
-    "sindhi": "sd",
-    "sinhala": "si",
-    "slovak": "sk",
-    "slovenian": "sl",
-    "somali": "so",
-    "spanish": "es",
-    "sundanese": "su",
-    "swahili": "sw",
-    "swedish": "sv",
-    "tajik": "tg",
-    "tamil": "ta",
-    "telugu": "te",
-    "thai": "th",
-    "turkish": "tr",
-    "ukrainian": "uk",
-    "urdu": "ur",
-    "uyghur": "ug",
-    "uzbek": "uz",
-    "vietnamese": "vi",
-    "welsh": "cy",
-    "xhosa": "xh",
-    "yiddish": "yi",
-    "yoruba": "yo",
-    "zulu": "zu",
-    # common short aliases and native names
-    "svenska": "sv",
-    "español": "es",
-    "deutsch": "de",
-    "français": "fr",
-    "italiano": "it",
-    "português": "pt",
-    "русский": "ru",
-    "中文": "zh-CN",
-    "日本語": "ja",
-    "한국어": "ko",
-    "nb": "no",  # norwegian bokmål alias
-    "zh": "zh-CN",
-}
-
-# also create reverse mapping for quick lookup by code
-_SUPPORTED_CODES = set(_LANG_NAME_TO_CODE.values())
+# Translation cache sizing. Translations of a line rarely change, so entries
+# live for a month and the file is capped at 64 MB.
+TRANSLATION_CACHE_TTL = 30 * 24 * 3600
+TRANSLATION_CACHE_MAX_BYTES = 64 * 1024 * 1024
+TRANSLATION_CACHE_MEMORY_SIZE = 4096
+
+# Pacing of requests to the gtx endpoint, which bans clients that send too
+# much: requests per second (with a burst allowance) and a cap on requests in
+# flight. The concurrency limit starts low and adapts (see api.ratelimit).
+TRANSLATE_HOST = "translate.googleapis.com"
+TRANSLATE_RATE = 10.0
+TRANSLATE_BURST = 20
+TRANSLATE_MAX_CONCURRENCY = 16
+TRANSLATE_INITIAL_CONCURRENCY = 4
+
+
+class TranslationError(ValueError):
+    """The translate service answered with something that isn't a translation."""
+
+
+class Throttled(TranslationError):
+    """The translate service is rate limiting us (a 429, or an HTML page instead of JSON)."""
+
+
+# The gtx endpoint rejects very long GET URLs. Keep the URL-encoded `q` of a
+# batched request below this many characters.
+BATCH_MAX_QUERY_CHARS = 5000
 
 
 def language_name_to_code(name: str) -> Optional[str]:
@@ -138,101 +48,74 @@ def language_name_to_code(name: str) -> Optional[str]:
       language_name_to_code("english") -> "en"
       language_name_to_code("en") -> "en"
       language_name_to_code("svenska") -> "sv"
-    Returns None if the language can't be resolved.
+      language_name_to_code("sweedish") -> "sv"
+    Returns None if the language can't be resolved or is ambiguous; see
+    api.languages.resolve for the ranked candidates.
     """
     if not name:
         return None
-    s = name.strip().lower()
-    # direct code passed in, accept if in supported codes or looks like two-letter code
-    if s in _SUPPORTED_CODES:
-        return s
-    # canonicalize common two-letter inputs (without region)
-    if len(s) == 2 and s.isalpha():
-        # allow passing codes like 'en', 'sv' even if they weren't in mapping values
-        return s
-    # remove punctuation and common words
-    s = re.sub(r'[^a-z\- ]', '', s)
-    s = s.replace("_", " ").strip()
-    # exact name match
-    if s in _LANG_NAME_TO_CODE:
-        return _LANG_NAME_TO_CODE[s]
-    # try each mapping key for partial match (e.g. "chinese simplified" -> zh-CN)
-    for key, code in _LANG_NAME_TO_CODE.items():
-        if s == key:
-            return code
-    for key, code in _LANG_NAME_TO_CODE.items():
-        if s in key:
-            return code
-    # if nothing matched, return None
-    return None
+    return languages.lookup(name)
 
 
 def code_to_display_name(code_or_name: str) -> str:
     """
-    Convert a language code or name to a human-friendly display name.
-
-    Accepts either a code (e.g. 'en', 'es') or a language name ('spanish') and
-    returns a lower-case display name. If the code is 'es' we intentionally
-    return the user-requested string 'spaish'. If we can't resolve the code,
-    return the original input.
+    Convert a language code or name to a human-friendly, lower-case display
+    name ('es' -> 'spanish'). If it can't be resolved, return the input
+    lower-cased.
     """
     if not code_or_name:
         return "unknown"
-
     s = str(code_or_name).strip()
-    # try to normalize to a code first
-    code = None
-    s_lower = s.lower()
-    if s_lower in _SUPPORTED_CODES or (len(s_lower) == 2 and s_lower.isalpha()):
-        code = s_lower
-    else:
-        code = language_name_to_code(s)
-
+    code = languages.lookup(s)
     if not code:
-        # couldn't normalize — return the original input lowercased
-        return s_lower
-
-    # prefer an ASCII/English-looking name for the code
-    for name, c in _LANG_NAME_TO_CODE.items():
-        if c.lower() == code and all(ord(ch) < 128 for ch in name):
-            return name.lower()
-
-    # fallback to any matching mapping
-    for name, c in _LANG_NAME_TO_CODE.items():
-        if c.lower() == code:
-            return name.lower()
-
-    # last resort: return the code itself
-    return code
-
-def _extract_header(formatted: str) -> Tuple[str, str]:
-    if not formatted:
-        return "", ""
-    parts = formatted.split("\n\n", 1)
-    if len(parts) == 2 and "—" in parts[0]:
-        # The provider may include a decorative underline (e.g. a line of
-        # dashes) directly under the "Title — Artist" line. Remove any
-        # lines that consist only of punctuation/whitespace so the header
-        # becomes just the canonical title/artist string.
-        header_block = parts[0].strip()
-        header_lines = [ln for ln in header_block.splitlines() if not re.match(r'^[\-\s]+$', ln)]
-        header = header_lines[0].strip() if header_lines else header_block.splitlines()[0].strip()
-        return header, parts[1].strip()
-    return "", formatted.strip()
-
-def detect_language(formatted_or_text: str) -> str:
+        return s.lower()
+    return languages.display_name(code)
+
+
+def _env_number(name: str, default, kind):
+    try:
+        return max(0, kind(config.getenv(name, default)))
+    except ValueError:
+        return default
+
+
+_translate_limiter: Optional[ratelimit.HostLimiter] = None
+
+
+def translate_limiter() -> ratelimit.HostLimiter:
     """
-    Detect language of provided lyrics or formatted string using the same
-    Google Translate endpoint (no extra deps). Returns ISO code (e.g. 'en', 'es')
-    or 'unknown' on failure.
+    The limiter every request to the translate endpoint goes through. Set
+    LYRINGO_TRANSLATE_RATE (requests/second, 0 for no limit) and
+    LYRINGO_TRANSLATE_CONCURRENCY (most requests in flight) to tune it.
     """
-    try:
-        # reuse header extractor if present
-        header, body = _extract_header(formatted_or_text)
-    except Exception:
-        body = formatted_or_text or ""
+    global _translate_limiter
+    if _translate_limiter is None:
+        # The registry makes sure racing first callers get the same limiter.
+        _translate_limiter = ratelimit.limiter(
+            TRANSLATE_HOST,
+            rate=_env_number("LYRINGO_TRANSLATE_RATE", TRANSLATE_RATE, float),
+            burst=TRANSLATE_BURST,
+            max_concurrency=max(1, _env_number("LYRINGO_TRANSLATE_CONCURRENCY", TRANSLATE_MAX_CONCURRENCY, int)),
+            initial_concurrency=TRANSLATE_INITIAL_CONCURRENCY,
+        )
+    return _translate_limiter
+
+
+def detect_language(text: str) -> str:
+    """
+    Detect language of provided lyrics text. Returns ISO code (e.g. 'en',
+    'es') or 'unknown' on failure. Decided offline by api.langdetect; only
+    when it isn't confident enough is the Google Translate endpoint asked.
+    """
+    code, confidence = langdetect.detect(text)
+    if confidence >= langdetect.min_confidence():
+        return code
+    return _detect_language_remote(text)
 
-    body = (body or "").strip()
+
+@metrics.instrument("translate.detect_language")
+def _detect_language_remote(text: str) -> str:
+    body = (text or "").strip()
     if not body:
         return "unknown"
 
@@ -241,7 +124,7 @@ def detect_language(formatted_or_text: str) -> str:
     params = {"client": "gtx", "sl": "auto", "tl": "en", "dt": "t", "q": sample}
 
     try:
-        resp = requests.get(GOOGLE_TRANSLATE_URL, params=params, timeout=10)
+        resp = transport.get(GOOGLE_TRANSLATE_URL, params=params, limiter=translate_limiter())
         resp.raise_for_status()
         data = resp.json()
         # Typical response shape: [ [[...]], null, "detected_lang", ... ]
@@ -255,9 +138,58 @@ def detect_language(formatted_or_text: str) -> str:
 
     return "unknown"
 
-def _translate_paragraph(paragraph: str, target_lang: str) -> str:
-    if not paragraph.strip():
-        return ""
+_translation_cache: Optional[TieredCache] = None
+_translation_cache_lock = threading.Lock()
+
+
+def translation_cache() -> TieredCache:
+    """
+    Shared (paragraph, target language) -> translation cache. Lives in memory
+    and in translations.sqlite3 under the Lyringo cache dir so it is reused
+    across songs and sessions. Set LYRINGO_CACHE_DIR to move it.
+    """
+    global _translation_cache
+    with _translation_cache_lock:
+        if _translation_cache is None:
+            _translation_cache = TieredCache(
+                os.path.join(cache_dir(), "translations.sqlite3"),
+                table="translations",
+                memory_size=TRANSLATION_CACHE_MEMORY_SIZE,
+                ttl=TRANSLATION_CACHE_TTL,
+                max_bytes=TRANSLATION_CACHE_MAX_BYTES,
+            )
+        return _translation_cache
+
+
+def cache_stats() -> Dict[str, int]:
+    """Hit/miss counters of the translation cache."""
+    return translation_cache().stats()
+
+
+def _translation_key(paragraph: str, target_lang: str) -> str:
+    # Whitespace is normalized within each line, but line breaks are kept: a
+    # multi-line translation is split back into lines, so "a\nb" and "a b"
+    # must not share an entry. Single lines keep the keys they always had.
+    text = "\n".join(normalize_text(line) for line in (paragraph or "").split("\n"))
+    return make_key("translate", target_lang.lower(), text)
+
+
+# Prefetch workers of different games often ask for the same paragraph (a
+# popular song, a chorus) at the same moment; they share one request.
+_translation_flight = singleflight.Group("translate.request")
+
+
+def _request_translation(paragraph: str, target_lang: str) -> str:
+    """
+    Send one paragraph to Google Translate. Raises Throttled when we are rate
+    limited and TranslationError when the response isn't a translation
+    otherwise. Identical requests in flight at the same time are sent once.
+    """
+    return _translation_flight.do((target_lang.lower(), paragraph), _send_translation, paragraph, target_lang)
+
+
+@metrics.instrument("translate.request")
+def _send_translation(paragraph: str, target_lang: str) -> str:
     params = {
         "client": "gtx",
         "sl": "auto",
@@ -265,44 +197,166 @@ def _translate_paragraph(paragraph: str, target_lang: str) -> str:
         "dt": "t",
         "q": paragraph
     }
-    resp = requests.get(GOOGLE_TRANSLATE_URL, params=params, timeout=10)
-    resp.raise_for_status()
-    try:
-        data = resp.json()
-    except Exception:
-        # Response was not valid JSON (rate limit page, empty body, etc.).
-        # Let caller fall back; return the original paragraph so output stays usable.
-        return paragraph
+    limiter = translate_limiter()
+    attempt = 0
+    while True:
+        sent = time.perf_counter()
+        # The transport paces each attempt and retries 429s itself.
+        resp = transport.get(GOOGLE_TRANSLATE_URL, params=params, limiter=limiter)
+        if resp.status_code == 429:
+            raise Throttled("translate service is rate limiting us (HTTP 429)")
+        resp.raise_for_status()
+        try:
+            data = resp.json()
+            break
+        except ValueError as e:
+            # When rate limited the endpoint can also answer 200 with an
+            # HTML "unusual traffic" page.
+            limiter.throttled(sent)
+            if attempt >= transport.MAX_RETRIES:
+                raise Throttled("translate service is rate limiting us (no JSON in the response)") from e
+            attempt += 1
+            time.sleep(transport.backoff_delay(attempt))
 
     # defensive: ensure the expected shape exists
     try:
         segments = data[0]
-        translated = "".join(seg[0] for seg in segments if seg and len(seg) > 0 and seg[0])
-    except Exception:
-        # Unexpected response shape — return original paragraph
-        return paragraph
+        return "".join(seg[0] for seg in segments if seg and len(seg) > 0 and seg[0])
+    except Exception as e:
+        raise TranslationError("unexpected translate response shape") from e
+
+
+@metrics.instrument("translate.translate_paragraph")
+def _translate_paragraph(paragraph: str, target_lang: str) -> str:
+    """
+    Translate one paragraph, from the cache when possible. Failures raise
+    (TranslationError, Throttled, network errors) rather than passing the
+    original text off as its translation.
+    """
+    if not paragraph.strip():
+        return ""
+    cache = translation_cache()
+    key = _translation_key(paragraph, target_lang)
+    cached = cache.get(key)
+    if cached is not None:
+        return cached
+    translated = _request_translation(paragraph, target_lang)
+    cache.set(key, translated)
     return translated
 
-def translate_song(lyrics: str, target_language: str) -> str:
-    header, body = _extract_header(lyrics)
-    # split into paragraphs (preserve paragraphs separated by one or more blank lines)
-    paragraphs = [p for p in re.split(r'\n{2,}', body) if p.strip()]
+def _pack_batches(lines: List[str], max_chars: int) -> List[List[str]]:
+    """
+    Group lines into batches whose newline-joined, URL-encoded form stays under
+    `max_chars`. A single line longer than the limit gets a batch of its own.
+    """
+    batches: List[List[str]] = []
+    current: List[str] = []
+    size = 0
+    for line in lines:
+        # +3 for the encoded "\n" separator
+        encoded = len(quote(line, safe="")) + 3
+        if current and size + encoded > max_chars:
+            batches.append(current)
+            current, size = [], 0
+        current.append(line)
+        size += encoded
+    if current:
+        batches.append(current)
+    return batches
 
-    translated_parts = []
-    for p in paragraphs:
-        try:
-            translated = _translate_paragraph(p, target_language)
-        except Exception as e:
-            # on failure, include the original paragraph so output is still usable
-            translated = p
-        translated_parts.append(translated)
 
-    translated_body = "\n\n".join(translated_parts)
+def _translate_batch(batch: List[str], target_lang: str) -> List[str]:
+    """
+    Translate a batch of lines in one request and split the result back on
+    newlines. If the translator merged or split lines, fall back to
+    translating each line on its own.
+    """
+    if len(batch) == 1:
+        return [_translate_paragraph(batch[0], target_lang)]
+    try:
+        translated = _request_translation("\n".join(batch), target_lang)
+    except Throttled:
+        # Line by line would only send more requests.
+        raise
+    except TranslationError:
+        translated = None
+    if translated is not None:
+        parts = translated.split("\n")
+        if len(parts) == len(batch):
+            cache = translation_cache()
+            results = [part.strip() for part in parts]
+            for line, result in zip(batch, results):
+                cache.set(_translation_key(line, target_lang), result)
+            return results
+    return [_translate_paragraph(line, target_lang) for line in batch]
+
+
+def translate_lines(lines: List[str], target_language: str, max_query_chars: int = BATCH_MAX_QUERY_CHARS) -> List[str]:
+    """
+    Translate many lines with as few requests as possible.
+
+    Returns exactly one translation per input line, in order. Blank lines map
+    to "". Lines already in the translation cache are not sent again and
+    duplicate lines are only sent once. Raises like _translate_paragraph when
+    a batch can't be translated; batches done before that stay cached.
+    """
+    results: List[Optional[str]] = [None] * len(lines)
+    cache = translation_cache()
+    pending: Dict[str, List[int]] = {}
+    for i, line in enumerate(lines):
+        text = " ".join((line or "").split())
+        if not text:
+            results[i] = ""
+            continue
+        cached = cache.get(_translation_key(text, target_language))
+        if cached is not None:
+            results[i] = cached
+            continue
+        pending.setdefault(text, []).append(i)
+
+    for batch in _pack_batches(list(pending), max_query_chars):
+        translated = _translate_batch(batch, target_language)
+        for text, result in zip(batch, translated):
+            for i in pending[text]:
+                results[i] = result
 
-    if header:
-        sep = "\n" + "-" * max(3, len(header)) + "\n\n"
-        translated_formatted = f"{header}{sep}{translated_body}"
+    return [r if r is not None else "" for r in results]
+
+
+def translate_paragraph_lines(lines: List[str], target_language: str) -> List[str]:
+    """
+    Translate the lines of one paragraph in a single request, so the
+    translator sees them in context, and split the result back into lines.
+
+    Returns one translation per input line. Every line is memoized in the
+    translation cache, so a repeated chorus (in this song or another) costs
+    no request at all. If the translator merges or splits lines, or the
+    paragraph is too long for one request, each line is translated on its own.
+    """
+    texts = [" ".join((line or "").split()) for line in lines]
+    cache = translation_cache()
+    results = [cache.get(_translation_key(t, target_language)) if t else "" for t in texts]
+    missing = [t for t, r in zip(texts, results) if r is None]
+    if not missing:
+        return results
+
+    # Send the whole paragraph, not just the missing lines, to keep the context.
+    paragraph = [t for t in texts if t]
+    if len(_pack_batches(paragraph, BATCH_MAX_QUERY_CHARS)) == 1:
+        translated = _translate_batch(paragraph, target_language)
     else:
-        translated_formatted = translated_body
+        translated = [_translate_paragraph(t, target_language) for t in paragraph]
+    by_text = dict(zip(paragraph, translated))
+    return [by_text[t] if t else "" for t in texts]
+
 
-    return translated_formatted
\ No newline at end of file
+def translate_song(lyrics: Lyrics, target_language: str) -> Lyrics:
+    """
+    Translate a whole song, paragraph by paragraph, keeping its line structure.
+    Raises if any paragraph can't be translated, so bulk jobs record the song
+    as failed instead of storing untranslated lines.
+    """
+    paragraphs = []
+    for paragraph in lyrics.paragraphs:
+        paragraphs.append(tuple(translate_paragraph_lines(list(paragraph), target_language)))
+    return Lyrics(lyrics.title, lyrics.artist, tuple(paragraphs), target_language)
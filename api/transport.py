@@ -0,0 +1,78 @@
+import random
+import threading
+from typing import TYPE_CHECKING, Optional
+from urllib.parse import urlsplit
+
+from api import config
+
+# requests is only imported once the first request is made (see session()).
+if TYPE_CHECKING:
+    import requests
+    from api.pooled_session import PooledSession
+
+# Connections kept alive per host. Raise it when many threads talk to the same
+# upstream (prefetching, bulk jobs).
+DEFAULT_POOL_SIZE = 10
+
+# Seconds to wait for a response, per upstream host.
+DEFAULT_TIMEOUT = 10
+HOST_TIMEOUTS = {
+    "accounts.spotify.com": 10,
+    "api.spotify.com": 10,
+    "translate.googleapis.com": 10,
+    "api.genius.com": 15,
+    "genius.com": 15,
+}
+
+# Retry policy: responses with these statuses and timeouts/connection errors
+# are retried with jittered exponential backoff.
+MAX_RETRIES = 3
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 8.0
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+
+def timeout_for(url: str) -> float:
+    """Timeout configured for the host of `url`."""
+    host = urlsplit(url).hostname or ""
+    return HOST_TIMEOUTS.get(host, DEFAULT_TIMEOUT)
+
+
+def backoff_delay(attempt: int, retry_after: Optional[str] = None) -> float:
+    """
+    Seconds to sleep before retry number `attempt` (starting at 1). Uses "full
+    jitter" so parallel clients don't retry in lockstep, and honours a
+    numeric Retry-After header when the server sends one.
+    """
+    if retry_after:
+        try:
+            return min(BACKOFF_MAX, max(0.0, float(retry_after)))
+        except ValueError:
+            pass
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * (2 ** attempt)))
+
+
+_session: Optional["PooledSession"] = None
+_session_lock = threading.Lock()
+
+
+def session() -> "PooledSession":
+    """The process-wide session shared by every api client."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            from api.pooled_session import PooledSession
+            try:
+                pool_size = int(config.getenv("LYRINGO_HTTP_POOL_SIZE", DEFAULT_POOL_SIZE))
+            except ValueError:
+                pool_size = DEFAULT_POOL_SIZE
+            _session = PooledSession(pool_size=max(1, pool_size))
+        return _session
+
+
+def get(url, **kwargs) -> "requests.Response":
+    return session().get(url, **kwargs)
+
+
+def post(url, **kwargs) -> "requests.Response":
+    return session().post(url, **kwargs)
@@ -0,0 +1,219 @@
+"""
+Offline end-to-end benchmark of a full game session.
+
+Starts local stand-ins for Spotify, Genius and Google Translate (see
+bench/stubs.py) and plays scripted sessions through main.main(), each in a
+fresh process with stdin answered by a script. Reports:
+
+- startup: process start until the first prompt is shown
+- time to first line: main() start until the first lyrics line is shown,
+  excluding time spent waiting on (scripted) user input
+- answer latency: ENTER on a translation until the answer is shown
+- upstream request counts per endpoint
+
+    python bench/e2e_session.py --sessions 5 --latency 0.08 --jitter 0.02
+    python bench/e2e_session.py --mode manual --warm --error-rate 0.05
+"""
+import argparse
+import builtins
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+RESULT_PREFIX = "BENCH_RESULT "
+
+
+class _Recorder:
+    """Stands in for sys.stdout in the child: discards output, timestamps key lines."""
+
+    def __init__(self, events):
+        self.events = events
+
+    def write(self, text):
+        if "Original:" in text:
+            self.events.append(("original", time.perf_counter()))
+        elif "Answer:" in text:
+            self.events.append(("answer", time.perf_counter()))
+        return len(text)
+
+    def flush(self):
+        pass
+
+
+def run_child(args):
+    """One scripted session. Runs inside the child process."""
+    from bench.stubs import PLAYLIST_LINK, configure_clients
+
+    events = []
+    waits = {"input": 0.0}
+    first_prompt = {}
+    script = {
+        "Input (1 or 2): ": "2" if args.mode == "manual" else "1",
+        "Paste your link here: ": PLAYLIST_LINK,
+        "link: ": "",
+        "Song title: ": args.title,
+        "Artist name: ": args.artist,
+        "Language: ": args.language,
+    }
+
+    def scripted_input(prompt=""):
+        start = time.perf_counter()
+        first_prompt.setdefault("at", time.time())
+        if prompt == "Translate: ":
+            # The player thinks about the line; this is where prefetching pays off.
+            time.sleep(args.think)
+            reply = "my answer"
+            events.append(("submit", time.perf_counter()))
+        else:
+            reply = script.get(prompt, "")
+        waits["input"] += time.perf_counter() - start
+        return reply
+
+    builtins.input = scripted_input
+    sys.stdout = _Recorder(events)
+
+    import main as game
+    configure_clients(json.loads(args.urls))
+
+    started = time.perf_counter()
+    try:
+        game.main()
+    finally:
+        sys.stdout = sys.__stdout__
+
+    # Time to first line, minus what the script spent "typing" before it.
+    first_line = None
+    input_before_first = 0.0
+    latencies = []
+    submitted = None
+    for kind, at in events:
+        if kind == "original" and first_line is None:
+            first_line = at - started
+        elif kind == "submit":
+            submitted = at
+            if first_line is None:
+                input_before_first += args.think
+        elif kind == "answer" and submitted is not None:
+            latencies.append(at - submitted)
+            submitted = None
+
+    result = {
+        "startup": first_prompt.get("at", time.time()) - args.spawned_at,
+        "first_line": None if first_line is None else first_line - input_before_first,
+        "answer_latencies": latencies,
+        "lines": len(latencies),
+    }
+    sys.__stdout__.write(RESULT_PREFIX + json.dumps(result) + "\n")
+
+
+def percentile(values, p):
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * p / 100
+    lo, hi = int(k), min(int(k) + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo)
+
+
+def run_session(args, urls, cache_dir):
+    env = dict(os.environ)
+    env.update({
+        "LYRINGO_CACHE_DIR": cache_dir,
+        "SPOTIFY_CLIENT_ID": "bench",
+        "SPOTIFY_CLIENT_SECRET": "bench",
+        "GENIUS_ACCESS_TOKEN": "bench",
+    })
+    cmd = [
+        sys.executable, os.path.abspath(__file__), "--child",
+        "--urls", json.dumps(urls),
+        "--mode", args.mode,
+        "--language", args.language,
+        "--think", str(args.think),
+        "--title", args.title,
+        "--artist", args.artist,
+    ]
+    spawned_at = time.time()
+    out = subprocess.run(cmd + ["--spawned-at", repr(spawned_at)], cwd=ROOT, env=env,
+                         capture_output=True, text=True)
+    for line in out.stdout.splitlines():
+        if line.startswith(RESULT_PREFIX):
+            return json.loads(line[len(RESULT_PREFIX):])
+    raise RuntimeError(f"session produced no result:\n{out.stdout[-2000:]}\n{out.stderr[-2000:]}")
+
+
+def fmt_ms(seconds):
+    return "   n/a" if seconds is None or seconds != seconds else f"{seconds * 1000:7.1f} ms"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=3)
+    parser.add_argument("--mode", choices=("playlist", "manual"), default="playlist")
+    parser.add_argument("--language", default="swedish")
+    parser.add_argument("--think", type=float, default=0.3, help="scripted seconds spent typing each answer")
+    parser.add_argument("--warm", action="store_true", help="share one cache dir across sessions")
+    parser.add_argument("--latency", type=float, default=0.05, help="upstream latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--tracks", type=int, default=500)
+    parser.add_argument("--no-lyrics-rate", type=float, default=0.3)
+    parser.add_argument("--lines", type=int, default=12, help="lyrics lines per song")
+    # used by the child process
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--urls", help=argparse.SUPPRESS)
+    parser.add_argument("--spawned-at", type=float, help=argparse.SUPPRESS)
+    parser.add_argument("--title", default="", help=argparse.SUPPRESS)
+    parser.add_argument("--artist", default="", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args)
+        return
+
+    from bench.stubs import StubConfig, Upstreams
+
+    config = StubConfig(
+        latency=args.latency, jitter=args.jitter, error_rate=args.error_rate, tracks=args.tracks,
+        no_lyrics_rate=args.no_lyrics_rate, lines_per_song=args.lines,
+    )
+    results = []
+    with Upstreams(config) as upstreams:
+        if args.mode == "manual":
+            # Search for the first song that has lyrics.
+            title, artist, _ = next(e for e in upstreams.catalog if e and e[2])
+            args.title, args.artist = title, artist
+        shared_cache = tempfile.mkdtemp(prefix="lyringo-e2e-")
+        for n in range(args.sessions):
+            cache = shared_cache if args.warm else tempfile.mkdtemp(prefix="lyringo-e2e-")
+            result = run_session(args, upstreams.urls(), cache)
+            results.append(result)
+            print(f"session {n + 1}: startup {fmt_ms(result['startup'])}  first line {fmt_ms(result['first_line'])}  "
+                  f"{result['lines']} lines")
+        counts = upstreams.request_counts()
+
+    latencies = [x for r in results for x in r["answer_latencies"]]
+    first_lines = [r["first_line"] for r in results if r["first_line"] is not None]
+    print("")
+    print(f"startup (median)            {fmt_ms(statistics.median(r['startup'] for r in results))}")
+    print(f"time to first line (median) {fmt_ms(statistics.median(first_lines) if first_lines else None)}")
+    print(f"answer latency p50          {fmt_ms(percentile(latencies, 50))}")
+    print(f"answer latency p90          {fmt_ms(percentile(latencies, 90))}")
+    print(f"answer latency p99          {fmt_ms(percentile(latencies, 99))}")
+    print("")
+    total = 0
+    for name, endpoints in counts.items():
+        for endpoint, count in sorted(endpoints.items()):
+            print(f"{name:>9} {endpoint:<16} {count:>6} requests")
+            total += count
+    print(f"{'total':>9} {'':<16} {total:>6} requests ({total / max(1, len(results)):.1f} per session)")
+
+
+if __name__ == "__main__":
+    main()
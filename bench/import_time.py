@@ -0,0 +1,79 @@
+"""
+Measure how long `import main` takes, using `python -X importtime`.
+
+Prints the median cumulative import time of main over several runs and the
+slowest modules it pulled in. Exits non-zero when the budget is exceeded or
+when one of the heavy upstream libraries is imported eagerly, so it can be
+used as a regression check:
+
+    python bench/import_time.py --runs 5 --budget-ms 60
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# These must only be imported on first use, never at startup.
+LAZY_MODULES = ("requests", "lyricsgenius", "bs4", "dotenv")
+
+
+def parse_importtime(stderr):
+    """Return a list of (module, self_us, cumulative_us) from -X importtime output."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        rows.append((name.strip(), int(self_us), int(cumulative_us)))
+    return rows
+
+
+def measure_once():
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return parse_importtime(result.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10, help="how many of the slowest modules to list")
+    parser.add_argument("--budget-ms", type=float, default=None, help="fail if `import main` takes longer")
+    args = parser.parse_args()
+
+    totals = []
+    rows = []
+    for _ in range(args.runs):
+        rows = measure_once()
+        main_row = next((r for r in rows if r[0] == "main"), None)
+        if main_row is None:
+            sys.exit("could not find `main` in the importtime output")
+        totals.append(main_row[2] / 1000)
+
+    median = statistics.median(totals)
+    print(f"import main: median {median:.1f} ms over {args.runs} runs (min {min(totals):.1f}, max {max(totals):.1f})")
+    print("slowest modules (self time, last run):")
+    for name, self_us, cumulative_us in sorted(rows, key=lambda r: r[1], reverse=True)[:args.top]:
+        print(f"  {self_us / 1000:>7.1f} ms  {cumulative_us / 1000:>7.1f} ms cumulative  {name}")
+
+    failed = False
+    eager = sorted({r[0] for r in rows if r[0].split(".")[0] in LAZY_MODULES and "." not in r[0]})
+    if eager:
+        print(f"FAIL: imported at startup but should be lazy: {', '.join(eager)}")
+        failed = True
+    if args.budget_ms is not None and median > args.budget_ms:
+        print(f"FAIL: {median:.1f} ms is over the {args.budget_ms:.1f} ms budget")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
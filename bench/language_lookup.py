@@ -0,0 +1,77 @@
+"""
+Time language name resolution (api.languages, used by
+translate_client.language_name_to_code) against the linear scan it replaced,
+on exact names, codes, prefixes, typos and unknown input, and show what each
+one answers for the queries where they differ.
+
+    python bench/language_lookup.py --rounds 20000
+"""
+import argparse
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api import languages  # noqa: E402
+
+QUERIES = {
+    "exact": ["english", "swedish", "Español", "chinese (simplified)", "zulu"],
+    "code": ["en", "sv", "zh-CN", "hmn", "ceb"],
+    "prefix": ["swed", "portu", "trad", "lux", "gaelic"],
+    "typo": ["sweedish", "portugese", "norweigan", "japanse", "germn"],
+    "unknown": ["klingon", "ish", "elvish", "qwerty", "xyzzy"],
+}
+
+
+def linear_lookup(name):
+    # The previous language_name_to_code: a scan with substring matching.
+    s = name.strip().lower()
+    codes = set(languages.NAMES.values())
+    if s in codes:
+        return s
+    if len(s) == 2 and s.isalpha():
+        return s
+    s = re.sub(r'[^a-z\- ]', '', s).replace("_", " ").strip()
+    if s in languages.NAMES:
+        return languages.NAMES[s]
+    for key, code in languages.NAMES.items():
+        if s in key:
+            return code
+    return None
+
+
+def per_call_us(fn, queries, rounds):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for query in queries:
+            fn(query)
+    return (time.perf_counter() - start) / (rounds * len(queries)) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rounds", type=int, default=5000)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    languages.lookup("english")
+    print(f"index built in {(time.perf_counter() - start) * 1000:.2f} ms ({len(languages.NAMES)} names)\n")
+
+    print(f"{'queries':<10} {'linear us':>10} {'indexed us':>11}")
+    for kind, queries in QUERIES.items():
+        linear = per_call_us(linear_lookup, queries, args.rounds)
+        indexed = per_call_us(languages.lookup, queries, args.rounds)
+        print(f"{kind:<10} {linear:>10.2f} {indexed:>11.2f}")
+
+    print("\nanswers that changed:")
+    for queries in QUERIES.values():
+        for query in queries:
+            before, after = linear_lookup(query), languages.lookup(query)
+            if before != after:
+                print(f"  {query!r:<24} {before!s:<6} -> {after}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Compare reading a whole playlist into a list (get_playlist_by_link) with
+streaming it (iter_playlist_tracks) and sampling tracks on the fly
+(sample_playlist), against the local Spotify stand-in from bench/stubs.py.
+
+Reports time to the first track, total time and peak Python memory
+(tracemalloc) for each. The stub runs in this process, so the peak includes
+the pages it is encoding at the same time.
+
+    python bench/playlist_stream.py --tracks 10000 --latency 0.05
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ["LYRINGO_CACHE_DIR"] = tempfile.mkdtemp(prefix="lyringo-bench-")
+os.environ.setdefault("SPOTIFY_CLIENT_ID", "bench")
+os.environ.setdefault("SPOTIFY_CLIENT_SECRET", "bench")
+
+import api.spotify as spotify_client  # noqa: E402
+from bench.stubs import PLAYLIST_LINK, StubConfig, Upstreams  # noqa: E402
+
+
+def measure(label, fn):
+    tracemalloc.start()
+    start = time.perf_counter()
+    first, count = fn(start)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    first_ms = "     n/a" if first is None else f"{first * 1000:>8.1f}"
+    print(f"{label:<10} first track {first_ms} ms  total {elapsed * 1000:>8.1f} ms  "
+          f"peak {peak / 1024:>8.1f} KiB  {count} tracks")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tracks", type=int, default=5000)
+    parser.add_argument("--latency", type=float, default=0.05, help="simulated round trip in seconds")
+    parser.add_argument("--k", type=int, default=3, help="tracks to sample")
+    args = parser.parse_args()
+
+    with Upstreams(StubConfig(latency=args.latency, tracks=args.tracks)) as upstreams:
+        upstreams.configure_clients()
+        token = spotify_client.get_token()
+
+        def full_list(start):
+            tracks = spotify_client.get_playlist_by_link(token, PLAYLIST_LINK)
+            # nothing is usable until the whole list is back
+            return time.perf_counter() - start, len(tracks)
+
+        def stream(start):
+            first, count = None, 0
+            for _ in spotify_client.iter_playlist_tracks(token, PLAYLIST_LINK):
+                if first is None:
+                    first = time.perf_counter() - start
+                count += 1
+            return first, count
+
+        def sample(start):
+            picked = spotify_client.sample_playlist(token, PLAYLIST_LINK, args.k)
+            return None, len(picked)
+
+        measure("list", full_list)
+        measure("stream", stream)
+        measure("reservoir", sample)
+
+
+if __name__ == "__main__":
+    main()
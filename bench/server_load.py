@@ -0,0 +1,229 @@
+"""
+Load-test the game server (server.py) with many concurrent players.
+
+Starts the local stand-ins for Spotify, Genius and Google Translate (see
+bench/stubs.py), runs server.py against them in a child process and plays
+scripted games over WebSocket, `--concurrency` at a time. Reports:
+
+- sessions/sec: finished games per second of wall time
+- time per line: ENTER on a translation until the answer is on screen
+  (p50/p90/p99), which is where a player waits on upstreams
+- time to first line: connecting until the first lyrics line is shown
+- upstream request counts per endpoint
+
+    python bench/server_load.py --sessions 200 --concurrency 50 --think 0.1
+    python bench/server_load.py --mode manual --latency 0.1 --workers 8
+"""
+import argparse
+import asyncio
+import base64
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench.e2e_session import fmt_ms, percentile  # noqa: E402
+
+PORT_PREFIX = "LISTENING "
+
+
+def run_server_child(args):
+    """Runs inside the child process: the server, pointed at the stubs."""
+    import server
+    from bench.stubs import configure_clients
+
+    configure_clients(json.loads(args.urls))
+
+    async def serve():
+        game_server = server.GameServer(args.workers, args.translate_workers, max_sessions=args.concurrency * 2)
+        _, port = await game_server.start("127.0.0.1", 0)
+        print(PORT_PREFIX + str(port), flush=True)
+        await game_server.serve_forever()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+
+
+async def connect(port):
+    import server
+
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    key = base64.b64encode(os.urandom(16)).decode("ascii")
+    writer.write((
+        "GET /ws HTTP/1.1\r\n"
+        f"Host: 127.0.0.1:{port}\r\n"
+        "Upgrade: websocket\r\n"
+        "Connection: Upgrade\r\n"
+        f"Sec-WebSocket-Key: {key}\r\n"
+        "Sec-WebSocket-Version: 13\r\n\r\n"
+    ).encode("ascii"))
+    head = await reader.readuntil(b"\r\n\r\n")
+    if b" 101 " not in head.split(b"\r\n", 1)[0]:
+        raise ConnectionError(head.decode("latin-1").split("\r\n", 1)[0])
+
+    async def receive():
+        message = await server.read_message(reader, writer, mask=True)
+        return None if message is None else json.loads(message)
+
+    async def send(data):
+        writer.write(server.encode_frame(server.OP_TEXT, json.dumps(data).encode("utf-8"), mask=True))
+        await writer.drain()
+
+    return receive, send, writer
+
+
+async def play(port, args, script, stats):
+    """One scripted game over WebSocket."""
+    started = time.perf_counter()
+    receive, send, writer = await connect(port)
+    lines = 0
+    submitted = None
+    first_line_shown = False
+    try:
+        while True:
+            screen = await receive()
+            if screen is None:
+                break
+            now = time.perf_counter()
+            shown = json.dumps(screen["messages"])
+            if "Original:" in shown and not first_line_shown:
+                first_line_shown = True
+                stats["first_lines"].append(now - started)
+            if submitted is not None and "Answer:" in shown:
+                stats["line_times"].append(now - submitted)
+                submitted = None
+                lines += 1
+            if screen["done"]:
+                break
+            if args.lines and lines >= args.lines:
+                await send({"quit": True})
+                continue
+            prompt = screen["prompt"]
+            if prompt == "Translate: ":
+                # The player thinks about the line while it is translated ahead.
+                await asyncio.sleep(args.think)
+                submitted = time.perf_counter()
+                await send({"input": "my answer"})
+            else:
+                await send({"input": script.get(prompt, "")})
+    finally:
+        writer.close()
+    return lines
+
+
+async def run_load(port, args, script):
+    stats = {"first_lines": [], "line_times": []}
+    results = {"done": 0, "failed": 0, "lines": 0, "errors": []}
+    slots = asyncio.Semaphore(args.concurrency)
+
+    async def one():
+        async with slots:
+            try:
+                lines = await play(port, args, script, stats)
+                results["lines"] += lines
+                results["done"] += 1
+            except Exception as e:
+                results["failed"] += 1
+                if len(results["errors"]) < 5:
+                    results["errors"].append(repr(e))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(args.sessions)))
+    return results, stats, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=100, help="games to play in total")
+    parser.add_argument("--concurrency", type=int, default=25, help="games in progress at once")
+    parser.add_argument("--mode", choices=("playlist", "manual"), default="playlist")
+    parser.add_argument("--language", default="swedish")
+    parser.add_argument("--think", type=float, default=0.1, help="scripted seconds spent typing each answer")
+    parser.add_argument("--lines", type=int, default=0, help="quit each game after this many lines (0: play it all)")
+    parser.add_argument("--workers", type=int, default=32, help="server threads for blocking upstream calls")
+    parser.add_argument("--translate-workers", type=int, default=16, help="server threads translating ahead")
+    parser.add_argument("--latency", type=float, default=0.05, help="upstream latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--tracks", type=int, default=500)
+    parser.add_argument("--no-lyrics-rate", type=float, default=0.3)
+    parser.add_argument("--lines-per-song", type=int, default=12)
+    # used by the server child process
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--urls", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        run_server_child(args)
+        return
+
+    from bench.stubs import PLAYLIST_LINK, StubConfig, Upstreams
+
+    config = StubConfig(
+        latency=args.latency, jitter=args.jitter, error_rate=args.error_rate, tracks=args.tracks,
+        no_lyrics_rate=args.no_lyrics_rate, lines_per_song=args.lines_per_song,
+    )
+    with Upstreams(config) as upstreams:
+        env = dict(os.environ)
+        env.update({
+            "LYRINGO_CACHE_DIR": tempfile.mkdtemp(prefix="lyringo-load-"),
+            "SPOTIFY_CLIENT_ID": "bench",
+            "SPOTIFY_CLIENT_SECRET": "bench",
+            "GENIUS_ACCESS_TOKEN": "bench",
+        })
+        cmd = [sys.executable, os.path.abspath(__file__), "--serve", "--urls", json.dumps(upstreams.urls()),
+               "--workers", str(args.workers), "--translate-workers", str(args.translate_workers),
+               "--concurrency", str(args.concurrency)]
+        child = subprocess.Popen(cmd, cwd=ROOT, env=env, stdout=subprocess.PIPE, text=True)
+        try:
+            line = child.stdout.readline()
+            if not line.startswith(PORT_PREFIX):
+                raise RuntimeError(f"server did not start: {line!r}")
+            port = int(line[len(PORT_PREFIX):])
+
+            title, artist = "", ""
+            if args.mode == "manual":
+                # Every game searches for the first song that has lyrics.
+                title, artist, _ = next(e for e in upstreams.catalog if e and e[2])
+            script = {
+                "Input (1 or 2): ": "2" if args.mode == "manual" else "1",
+                "Paste your link here: ": PLAYLIST_LINK,
+                "link: ": "",
+                "Song title: ": title,
+                "Artist name: ": artist,
+                "Language: ": args.language,
+            }
+            results, stats, elapsed = asyncio.run(run_load(port, args, script))
+        finally:
+            child.terminate()
+            child.wait()
+        counts = upstreams.request_counts()
+
+    print(f"games          {results['done']} done, {results['failed']} failed, {results['lines']} lines "
+          f"({args.concurrency} at a time, {args.workers} server workers)")
+    for error in results["errors"]:
+        print(f"  error: {error}")
+    print(f"wall time      {elapsed:7.2f} s")
+    print(f"sessions/sec   {results['done'] / elapsed:7.2f}")
+    print(f"first line     p50 {fmt_ms(percentile(stats['first_lines'], 50))}  "
+          f"p99 {fmt_ms(percentile(stats['first_lines'], 99))}")
+    print(f"time per line  p50 {fmt_ms(percentile(stats['line_times'], 50))}  "
+          f"p90 {fmt_ms(percentile(stats['line_times'], 90))}  p99 {fmt_ms(percentile(stats['line_times'], 99))}")
+    print("")
+    total = 0
+    for name, endpoints in counts.items():
+        for endpoint, count in sorted(endpoints.items()):
+            print(f"{name:>9} {endpoint:<16} {count:>6} requests")
+            total += count
+    print(f"{'total':>9} {'':<16} {total:>6} requests ({total / max(1, results['done']):.1f} per game)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,357 @@
+"""
+Local stand-ins for the three upstreams Lyringo talks to: Spotify (accounts
+and Web API), Genius (API, public API and lyrics pages) and the Google
+translate endpoint. Each stub runs on its own port with configurable latency,
+jitter and error rate, and counts the requests it serves.
+
+    with Upstreams(StubConfig(latency=0.05)) as upstreams:
+        upstreams.configure_clients()
+        ...
+        print(upstreams.request_counts())
+"""
+import html
+import json
+import random
+import threading
+import time
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+from urllib.parse import parse_qs, urlsplit
+
+PLAYLIST_ID = "stubplaylist"
+PLAYLIST_LINK = f"https://open.spotify.com/playlist/{PLAYLIST_ID}?si=bench"
+
+LYRIC_LINES = [
+    "Camino por la calle cuando cae la noche",
+    "y todas las luces cantan nuestra canción",
+    "abrázame fuerte, no me sueltes",
+    "la mañana llega demasiado pronto",
+    "bailábamos bajo la lluvia",
+    "nada se queda igual",
+]
+
+
+@dataclass
+class StubConfig:
+    latency: float = 0.05        # seconds added to every response
+    jitter: float = 0.0          # +/- uniform jitter around latency
+    error_rate: float = 0.0      # share of requests answered with 503 (429 for translate)
+    tracks: int = 500            # playlist size
+    unavailable_rate: float = 0.05  # share of null tracks in the playlist
+    no_lyrics_rate: float = 0.3     # share of songs Genius has no lyrics for
+    lines_per_song: int = 12
+    seed: int = 1
+    # Requests per second the translate stub tolerates (0: any). Going over
+    # gets the client banned for `translate_ban` seconds, during which every
+    # request is throttled, like the real endpoint does.
+    translate_rate: float = 0.0
+    translate_burst: int = 10
+    translate_ban: float = 2.0
+
+
+class _Stub:
+    """One HTTP server with latency/error injection and per-endpoint counters."""
+
+    def __init__(self, name: str, config: StubConfig):
+        self.name = name
+        self.config = config
+        self.counts: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._random = random.Random(config.seed)
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _reply(self, status: int, body, content_type="application/json"):
+                payload = body if isinstance(body, bytes) else json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def _handle(self, method: str):
+                url = urlsplit(self.path)
+                query = {k: v[0] for k, v in parse_qs(url.query).items()}
+                length = int(self.headers.get("Content-Length") or 0)
+                form = parse_qs(self.rfile.read(length).decode("utf-8")) if length else {}
+                endpoint = stub.endpoint_name(method, url.path)
+                stub._count(endpoint)
+                stub._delay()
+                if stub._fail():
+                    status, body, content_type = stub.error_response()
+                else:
+                    status, body, content_type = stub.route(method, url.path, query, form, self.headers)
+                self._reply(status, body, content_type)
+
+            def do_GET(self):
+                self._handle("GET")
+
+            def do_POST(self):
+                self._handle("POST")
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+        self._thread = threading.Thread(target=self.server.serve_forever, name=f"stub-{name}", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _count(self, endpoint: str):
+        with self._lock:
+            self.counts[endpoint] = self.counts.get(endpoint, 0) + 1
+
+    def _delay(self):
+        delay = self.config.latency
+        if self.config.jitter:
+            with self._lock:
+                delay += self._random.uniform(-self.config.jitter, self.config.jitter)
+        if delay > 0:
+            time.sleep(delay)
+
+    def _fail(self) -> bool:
+        if not self.config.error_rate:
+            return False
+        with self._lock:
+            return self._random.random() < self.config.error_rate
+
+    def error_response(self):
+        return 503, {"error": "stub failure"}, "application/json"
+
+    def endpoint_name(self, method: str, path: str) -> str:
+        return f"{method} {path}"
+
+    def route(self, method, path, query, form, headers):
+        raise NotImplementedError
+
+
+def _catalog(config: StubConfig):
+    """The shared playlist: (title, artist, has_lyrics) per position, None for unavailable."""
+    rng = random.Random(config.seed)
+    catalog: List[Optional[tuple]] = []
+    for i in range(config.tracks):
+        if rng.random() < config.unavailable_rate:
+            catalog.append(None)
+            continue
+        catalog.append((f"Canción {i}", f"Artista {i % 37}", rng.random() >= config.no_lyrics_rate))
+    return catalog
+
+
+class SpotifyStub(_Stub):
+    def __init__(self, config: StubConfig, catalog):
+        super().__init__("spotify", config)
+        self.catalog = catalog
+
+    def endpoint_name(self, method, path):
+        if path.endswith("/api/token"):
+            return "token"
+        if path.endswith("/tracks"):
+            return "playlist_tracks"
+        if "/v1/playlists/" in path:
+            return "playlist_meta"
+        return path
+
+    def _track(self, i):
+        entry = self.catalog[i]
+        if entry is None:
+            return {"track": None}
+        title, artist, _ = entry
+        return {"track": {"name": title, "artists": [{"name": artist}]}}
+
+    def route(self, method, path, query, form, headers):
+        if method == "POST" and path.endswith("/api/token"):
+            return 200, {"access_token": "stub-token", "token_type": "Bearer", "expires_in": 3600}, "application/json"
+        if not (headers.get("Authorization") or "").startswith("Bearer "):
+            return 401, {"error": {"status": 401, "message": "No token provided"}}, "application/json"
+        if path.endswith("/tracks"):
+            offset = int(query.get("offset", 0))
+            limit = int(query.get("limit", 100))
+            end = min(len(self.catalog), offset + limit)
+            items = [self._track(i) for i in range(offset, end)]
+            next_url = f"{self.url}{path}?offset={end}&limit={limit}" if end < len(self.catalog) else None
+            return 200, {"items": items, "total": len(self.catalog), "offset": offset, "limit": limit, "next": next_url}, "application/json"
+        if path.startswith("/v1/playlists/"):
+            return 200, {"snapshot_id": "stub-snapshot", "tracks": {"total": len(self.catalog)}}, "application/json"
+        return 404, {"error": "not found"}, "application/json"
+
+
+class GeniusStub(_Stub):
+    def __init__(self, config: StubConfig, catalog):
+        super().__init__("genius", config)
+        self.catalog = catalog
+        self.by_term = {}
+        for i, entry in enumerate(catalog):
+            if entry:
+                self.by_term[f"{entry[0]} {entry[1]}".lower()] = i
+
+    def endpoint_name(self, method, path):
+        if path.startswith("/api/search"):
+            return "search"
+        if path.startswith("/songs/"):
+            return "song"
+        if path.startswith("/lyrics/"):
+            return "lyrics_page"
+        return path
+
+    def _song_info(self, i):
+        title, artist, has_lyrics = self.catalog[i]
+        return {
+            "id": i,
+            "title": title,
+            "full_title": f"{title} by {artist}",
+            "primary_artist": {"name": artist},
+            "lyrics_state": "complete" if has_lyrics else "unreleased",
+            "instrumental": False,
+            "language": "es",
+            "url": f"https://genius.com/lyrics/{i}",
+            "path": f"/lyrics/{i}",
+        }
+
+    def _lyrics_html(self, i):
+        lines = [LYRIC_LINES[(i + n) % len(LYRIC_LINES)] for n in range(self.config.lines_per_song)]
+        # Paragraphs of four lines, like verses.
+        chunks = ["<br/>".join(html.escape(ln) for ln in lines[n:n + 4]) for n in range(0, len(lines), 4)]
+        body = "<br/><br/>".join(chunks)
+        return f'<html><body><div data-lyrics-container="true">{body}</div></body></html>'.encode("utf-8")
+
+    def route(self, method, path, query, form, headers):
+        if path.startswith("/api/search"):
+            i = self.by_term.get((query.get("q") or "").strip().lower())
+            hits = [] if i is None else [{"index": "song", "type": "song", "result": self._song_info(i)}]
+            return 200, {"meta": {"status": 200}, "response": {"sections": [{"type": "top_hit", "hits": hits}]}}, "application/json"
+        if path.startswith("/songs/"):
+            i = int(path.rsplit("/", 1)[1])
+            return 200, {"meta": {"status": 200}, "response": {"song": self._song_info(i)}}, "application/json"
+        if path.startswith("/lyrics/"):
+            return 200, self._lyrics_html(int(path.rsplit("/", 1)[1])), "text/html; charset=utf-8"
+        return 404, {"error": "not found"}, "application/json"
+
+
+class TranslateStub(_Stub):
+    def __init__(self, config: StubConfig):
+        super().__init__("translate", config)
+        self.throttled = 0
+        self._tokens = float(config.translate_burst)
+        self._refilled = time.perf_counter()
+        self._banned_until = 0.0
+
+    def endpoint_name(self, method, path):
+        return "translate"
+
+    def _fail(self) -> bool:
+        if self._over_rate():
+            with self._lock:
+                self.throttled += 1
+            return True
+        return super()._fail()
+
+    def _over_rate(self) -> bool:
+        rate = self.config.translate_rate
+        if not rate:
+            return False
+        with self._lock:
+            now = time.perf_counter()
+            if now < self._banned_until:
+                return True
+            self._tokens = min(self.config.translate_burst, self._tokens + (now - self._refilled) * rate)
+            self._refilled = now
+            if self._tokens < 1:
+                self._banned_until = now + self.config.translate_ban
+                return True
+            self._tokens -= 1
+            return False
+
+    def reset_limit(self):
+        with self._lock:
+            self.throttled = 0
+            self._tokens = float(self.config.translate_burst)
+            self._refilled = time.perf_counter()
+            self._banned_until = 0.0
+
+    def error_response(self):
+        # What Google sends when it rate limits: an HTML page, not JSON, with
+        # a 429 or sometimes a plain 200.
+        with self._lock:
+            status = 429 if self._random.random() < 0.5 else 200
+        return status, b"<html><body>Our systems have detected unusual traffic</body></html>", "text/html"
+
+    def route(self, method, path, query, form, headers):
+        text = query.get("q") or ""
+        target = query.get("tl") or "en"
+        # A deterministic "translation" that keeps the newline structure.
+        translated = "\n".join(f"[{target}] {line}" if line.strip() else line for line in text.split("\n"))
+        return 200, [[[translated, text, None, None]], None, "es"], "application/json"
+
+
+class Upstreams:
+    """Starts all three stubs and points the api clients at them."""
+
+    def __init__(self, config: Optional[StubConfig] = None):
+        self.config = config or StubConfig()
+        self.catalog = _catalog(self.config)
+        self.spotify = SpotifyStub(self.config, self.catalog)
+        self.genius = GeniusStub(self.config, self.catalog)
+        self.translate = TranslateStub(self.config)
+        self.stubs = [self.spotify, self.genius, self.translate]
+
+    def __enter__(self):
+        for stub in self.stubs:
+            stub.start()
+        return self
+
+    def __exit__(self, *exc):
+        for stub in self.stubs:
+            stub.stop()
+        return False
+
+    def urls(self) -> Dict[str, str]:
+        return {stub.name: stub.url for stub in self.stubs}
+
+    def request_counts(self) -> Dict[str, Dict[str, int]]:
+        return {stub.name: dict(stub.counts) for stub in self.stubs}
+
+    def reset_counts(self):
+        for stub in self.stubs:
+            with stub._lock:
+                stub.counts.clear()
+
+    def configure_clients(self):
+        configure_clients(self.urls())
+
+
+def configure_clients(urls: Dict[str, str]):
+    """
+    Point the api modules at stub URLs (as returned by Upstreams.urls()). The
+    Genius client is patched when it is first built so that its import cost
+    still lands where it would in a real session.
+    """
+    import api.genius as genius_client
+    import api.spotify as spotify_client
+    import api.translate as translate_client
+
+    spotify_client.SPOTIFY_TOKEN_URL = urls["spotify"] + "/api/token"
+    spotify_client.SPOTIFY_API_BASE_URL = urls["spotify"]
+    spotify_client.SPOTIFY_SEARCH_URL = urls["spotify"] + "/v1/search"
+    translate_client.GOOGLE_TRANSLATE_URL = urls["translate"] + "/translate_a/single"
+
+    build_client = genius_client.client
+    genius_root = urls["genius"] + "/"
+
+    def client():
+        genius = build_client()
+        genius.API_ROOT = genius_root
+        genius.PUBLIC_API_ROOT = genius_root + "api/"
+        genius.WEB_ROOT = genius_root
+        return genius
+
+    genius_client.client = client
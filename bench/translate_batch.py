@@ -0,0 +1,104 @@
+"""
+Compare per-line translation (one request per line) with translate_lines
+(batched requests) and translate_paragraph_lines (one request per unique
+paragraph, lines memoized across choruses).
+
+By default the Google endpoint is simulated with a fixed round-trip latency so
+the numbers are reproducible offline. Pass --live to hit the real endpoint.
+
+    python bench/translate_batch.py --lines 60 --latency 0.15 --chorus-every 2
+    python bench/translate_batch.py --live --target sv
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Start from an empty cache so both paths actually hit the upstream.
+os.environ["LYRINGO_CACHE_DIR"] = tempfile.mkdtemp(prefix="lyringo-bench-")
+
+import api.translate as translate_client  # noqa: E402
+
+SAMPLE_LINES = [
+    "I walked along the river when the night was young",
+    "and every light in town was singing our song",
+    "hold me closer, don't let go",
+    "the morning comes too soon, too slow",
+    "we were dancing in the rain",
+    "nothing ever stays the same",
+]
+
+
+def make_lines(n):
+    # Distinct lines, like a song without repeated chorus lines.
+    return [f"{SAMPLE_LINES[i % len(SAMPLE_LINES)]} ({i})" for i in range(n)]
+
+
+def make_paragraphs(lines, chorus_every):
+    # Verses of four lines, with the first verse repeated as a chorus.
+    verses = [lines[i:i + 4] for i in range(0, len(lines), 4)]
+    if not chorus_every:
+        return verses
+    chorus = verses[0]
+    song = []
+    for n, verse in enumerate(verses):
+        song.append(verse)
+        if (n + 1) % chorus_every == 0:
+            song.append(chorus)
+    return song
+
+
+def install_counter(latency, live):
+    counter = {"requests": 0}
+    real = translate_client._request_translation
+
+    def counted(paragraph, target_lang):
+        counter["requests"] += 1
+        if live:
+            return real(paragraph, target_lang)
+        time.sleep(latency)
+        return paragraph.upper()
+
+    translate_client._request_translation = counted
+    return counter
+
+
+def reset_cache():
+    cache = translate_client.translation_cache()
+    cache.memory.clear()
+    if cache.disk is not None:
+        cache.disk.clear()
+
+
+def run(label, fn, counter):
+    reset_cache()
+    counter["requests"] = 0
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<12} {counter['requests']:>4} requests  {elapsed * 1000:>9.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lines", type=int, default=60)
+    parser.add_argument("--target", default="es")
+    parser.add_argument("--latency", type=float, default=0.15, help="simulated round trip in seconds")
+    parser.add_argument("--chorus-every", type=int, default=2, help="repeat the first verse after every N verses (0: never)")
+    parser.add_argument("--live", action="store_true", help="use the real translate endpoint")
+    args = parser.parse_args()
+
+    paragraphs = make_paragraphs(make_lines(args.lines), args.chorus_every)
+    lines = [ln for paragraph in paragraphs for ln in paragraph]
+    counter = install_counter(args.latency, args.live)
+    print(f"{len(lines)} lines in {len(paragraphs)} paragraphs")
+
+    run("per-line", lambda: [translate_client._translate_paragraph(ln, args.target) for ln in lines], counter)
+    run("batched", lambda: translate_client.translate_lines(lines, args.target), counter)
+    run("paragraph", lambda: [translate_client.translate_paragraph_lines(p, args.target) for p in paragraphs], counter)
+
+
+if __name__ == "__main__":
+    main()
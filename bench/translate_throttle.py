@@ -0,0 +1,91 @@
+"""
+Translate many distinct lines flat out, the way warm.py and the prefetch
+pools do, against a translate stand-in that bans clients going over its rate
+(see bench/stubs.py), with and without client-side pacing (api.ratelimit).
+
+For each run: lines translated, lines that failed as throttled, wall time,
+requests the stand-in saw and how many of those it throttled. "unpaced" sends
+as fast as the workers can; "paced" goes through translate_limiter() with its
+token bucket and adaptive (AIMD) concurrency limit.
+
+    python bench/translate_throttle.py --lines 400 --workers 32 --server-rate 20
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("LYRINGO_CACHE_DIR", tempfile.mkdtemp(prefix="lyringo-throttle-"))
+
+import api.translate as translate_client  # noqa: E402
+from api import ratelimit  # noqa: E402
+from bench.stubs import StubConfig, Upstreams  # noqa: E402
+
+
+def reset_cache():
+    cache = translate_client.translation_cache()
+    cache.memory.clear()
+    if cache.disk is not None:
+        cache.disk.clear()
+
+
+def run(label, limiter, lines, workers, upstreams):
+    reset_cache()
+    upstreams.reset_counts()
+    upstreams.translate.reset_limit()
+    translate_client.translate_limiter = lambda: limiter
+    outcomes = {"ok": 0, "throttled": 0, "failed": 0}
+
+    def translate(line):
+        try:
+            translate_client._translate_paragraph(line, "en")
+            return "ok"
+        except translate_client.Throttled:
+            return "throttled"
+        except Exception:
+            return "failed"
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for outcome in executor.map(translate, lines):
+            outcomes[outcome] += 1
+    elapsed = time.perf_counter() - start
+    requests = upstreams.request_counts()["translate"].get("translate", 0)
+    print(f"{label:<8} {outcomes['ok']:>6} {outcomes['throttled']:>9} {outcomes['failed']:>6} {elapsed:>8.2f} "
+          f"{outcomes['ok'] / elapsed:>7.1f} {requests:>8} {upstreams.translate.throttled:>9}  "
+          f"limit {limiter.limit:.1f}, {limiter.throttles} throttles seen")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lines", type=int, default=400)
+    parser.add_argument("--workers", type=int, default=32, help="threads translating at once")
+    parser.add_argument("--latency", type=float, default=0.05, help="upstream latency in seconds")
+    parser.add_argument("--server-rate", type=float, default=20.0, help="requests/sec the stand-in tolerates")
+    parser.add_argument("--server-ban", type=float, default=2.0, help="seconds a client is banned for going over")
+    parser.add_argument("--rate", type=float, default=translate_client.TRANSLATE_RATE, help="client-side pacing, requests/sec")
+    args = parser.parse_args()
+
+    config = StubConfig(latency=args.latency, translate_rate=args.server_rate, translate_ban=args.server_ban)
+    lines = [f"línea número {i} de la canción" for i in range(args.lines)]
+    with Upstreams(config) as upstreams:
+        upstreams.configure_clients()
+        print(f"{args.lines} lines, {args.workers} workers, stand-in allows {args.server_rate:g} req/s "
+              f"(ban {args.server_ban:g} s)\n")
+        print(f"{'':<8} {'ok':>6} {'throttled':>9} {'failed':>6} {'wall s':>8} {'ok/s':>7} {'requests':>8} {'banned':>9}")
+        # Unpaced: no rate limit and a fixed concurrency limit as wide as the pool.
+        unpaced = ratelimit.HostLimiter("unpaced", rate=0, burst=1, max_concurrency=args.workers,
+                                        min_concurrency=args.workers)
+        run("unpaced", unpaced, lines, args.workers, upstreams)
+        paced = ratelimit.HostLimiter(translate_client.TRANSLATE_HOST, rate=args.rate,
+                                      burst=translate_client.TRANSLATE_BURST,
+                                      max_concurrency=translate_client.TRANSLATE_MAX_CONCURRENCY,
+                                      initial_concurrency=translate_client.TRANSLATE_INITIAL_CONCURRENCY)
+        run("paced", paced, lines, args.workers, upstreams)
+
+
+if __name__ == "__main__":
+    main()
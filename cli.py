@@ -82,22 +82,47 @@ def print_in_box(text: str | List[str], side_pad: int = 1, ver_pad: int = 1):
     print_lines(ver_pad)
     print(BOX_HORIZONTAL)
 
-def welcome():
+WELCOME_TEXT = [
+    "Welcome to Lyringo!",
+    "Learn new languages by translating your favourite songs."
+]
+
+CHOICES_TEXT = [
+    "There are two alternatives for selecting a song:",
+    "",
+    "1 - Let Lyringo choose a random song from your playlist.",
+    "2 - Manually search for a song."
+]
+
+def welcome(choices: bool = True):
     print_lyringo()
-    welcome_text = [
-        "Welcome to Lyringo!",
-        "Learn new languages by translating your favourite songs."
-    ]
-    print_in_box(welcome_text)
-
-    instructions_text = [
-        "There are two alternatives for selecting a song:",
-        "",
-        "1 - Let Lyringo choose a random song from your playlist.",
-        "2 - Manually search for a song."
-    ]
-    print_in_box(instructions_text)
-  
+    print_in_box(WELCOME_TEXT)
+    if not choices:
+        return
+
+    print_in_box(CHOICES_TEXT)
+
+def song_announcement(song) -> str:
+    return f"Chosen song: {song.title or 'Unknown track'} - {', '.join(song.artists) or 'Unknown artist'}"
+
+def announce_song(song):
+    print("")
+    print(song_announcement(song))
+    print("")
+
+def lyrics_header(lyrics) -> str:
+    """ The canonical "Title — Artist" line of a song's lyrics. """
+    return f"{lyrics.title} — {lyrics.artist}" if lyrics.artist else lyrics.title
+
+def song_name(song, lyrics=None) -> str:
+    """
+    How a song is shown to the player: the lyrics provider's canonical
+    title and artist when it found the song, otherwise what we searched for.
+    """
+    if lyrics is not None:
+        return lyrics_header(lyrics)
+    return f"{song.title} - {song.artist}" if song.artist else song.title
+
 if __name__ == "__main__":
     tip: str  = "2. Try to translate to your chosen language, press ENTER when you are done."
 
@@ -0,0 +1,550 @@
+"""
+The game flow (song selection, lyrics fetch, language choice and the line
+loop) as a state machine that never blocks.
+
+A Game doesn't read input, print or call upstreams itself. It queues output
+messages, then either waits for the player (`prompt` is set) or for a
+blocking call (`work` is set) that its driver runs wherever blocking is fine
+and hands back with `complete()` or `fail()`. main.py drives it from the
+terminal, running work in place; server.py drives many at once from an event
+loop, running work on a thread pool.
+
+    game = Game()
+    game.start()
+    while not game.done:
+        show(game.take_output())
+        if game.work is not None:
+            game.complete(game.work())
+        else:
+            game.feed(input(game.prompt))
+
+Messages are either a plain string (a line of text) or a list of strings
+(lines shown together in a box).
+"""
+from concurrent.futures import Executor
+from typing import Callable, List, Optional, Sequence, Tuple, Union
+
+import api.genius as genius_client
+import api.spotify as spotify_client
+import api.translate as translate_client
+from api import langdetect, languages, tracing
+from api.models import Lyrics, Song
+
+import cli
+import resolver
+from prefetch import TranslationPrefetcher
+
+Message = Union[str, List[str]]
+
+# Songs without lyrics tried from one playlist before asking for another.
+MAX_NO_LYRICS_ATTEMPTS = 3
+
+# States a game can be in while it waits for the player.
+CHOOSE_MODE = "choose mode"
+SONG_TITLE = "song title"
+ARTIST_NAME = "artist name"
+PLAYLIST_LINK = "playlist link"
+NEW_PLAYLIST_LINK = "new playlist link"
+LANGUAGE = "language"
+INSTRUCTIONS = "instructions"
+TRANSLATE = "translate"
+ANSWER = "answer"
+DONE = "done"
+
+INSTRUCTIONS_TEXT = [
+    "How to play:",
+    "",
+    "1. Examine the displayed line of lyrics.",
+    "2. Try to translate to your chosen language, press ENTER when you are done.",
+    "3. Compare you answer with the actual translation.",
+    "4. When you are done, press ENTER to display the next line of lyrics.",
+    "",
+    "Leave blank to skip a line.",
+    "Press Ctrl+C to quit early.",
+]
+
+
+def is_playlist_link(link: str) -> bool:
+    """A plausible Spotify playlist link or URI."""
+    return "spotify" in link and ("playlist" in link or link.startswith("spotify:"))
+
+
+class Work:
+    """A blocking call a game is waiting on. Calling it runs it, traced as `name`."""
+    __slots__ = ("name", "fn", "args")
+
+    def __init__(self, name: str, fn: Callable, **args):
+        self.name = name
+        self.fn = fn
+        self.args = args
+
+    def __call__(self):
+        with tracing.span(self.name, **self.args):
+            return self.fn()
+
+    def __repr__(self):
+        return f"Work({self.name!r})"
+
+
+class _Quiz:
+    """The lines to quiz and where their answers come from; built off the event loop."""
+    __slots__ = ("lines", "order", "prefetcher", "already_translated")
+
+    def __init__(self, lines, order, prefetcher, already_translated):
+        self.lines = lines
+        self.order = order
+        self.prefetcher = prefetcher
+        self.already_translated = already_translated
+
+    def close(self):
+        if self.prefetcher is not None:
+            self.prefetcher.close()
+
+
+def _build_quiz(lyrics: Lyrics, code: str, prefetch: bool, executor: Optional[Executor]) -> _Quiz:
+    # Lines already in the target language (an English chorus in a Spanish
+    # song, say) are neither quizzed nor translated.
+    order = [i for i, line in enumerate(lyrics.lines) if not langdetect.is_language(line, code)]
+    already_translated = not order
+    if already_translated:
+        order = list(range(len(lyrics.lines)))
+    keep = set(order)
+    paragraphs = []
+    first = 0
+    for paragraph in lyrics.paragraphs:
+        kept = [line for n, line in enumerate(paragraph, first) if n in keep]
+        if kept:
+            paragraphs.append(kept)
+        first += len(paragraph)
+    lines = [lyrics.lines[i] for i in order]
+    prefetcher = None
+    if prefetch:
+        # The target language is known now, so start translating the first
+        # lines in the background while the player reads the instructions.
+        # Each paragraph is translated in one request, so lines keep their
+        # context.
+        prefetcher = TranslationPrefetcher(lines, code, paragraphs=paragraphs, executor=executor)
+    return _Quiz(lines, order, prefetcher, already_translated)
+
+
+class Game:
+    """
+    One player's game. Call `start()` (or `start_with()` for a song that is
+    already known, like one from a song pack), then answer it until `done`:
+    `feed()` the player's reply while `prompt` is set, or run `work` and
+    pass its result to `complete()` (or its exception to `fail()`).
+
+    `prefetch_executor` is the pool lines are translated ahead on; by
+    default every game starts its own.
+    """
+
+    def __init__(self, prefetch_executor: Optional[Executor] = None, warm_playlists: Optional[bool] = None):
+        self.prefetch_executor = prefetch_executor
+        # Whether picking from an uncached playlist also reads all of it into
+        # the playlist cache in the background (see PlaylistSampler). None:
+        # LYRINGO_PLAYLIST_WARMUP decides.
+        if warm_playlists is None:
+            warm_playlists = spotify_client.playlist_warmup_enabled()
+        self.warm_playlists = warm_playlists
+        self.state: Optional[str] = None
+        self.prompt: Optional[str] = None
+        # Trace span name for the time spent answering `prompt`.
+        self.prompt_span = "user input"
+        self.work: Optional[Work] = None
+        self.done = False
+        # (line, the player's answer, the translation or None if it failed) per line played
+        self.answers: List[Tuple[str, str, Optional[str]]] = []
+        self._output: List[Message] = []
+        self._on_input: Optional[Callable[[str], None]] = None
+        self._on_done: Optional[Callable] = None
+        self._on_error: Optional[Callable[[Exception], None]] = None
+
+        self._manual = False
+        self._token = None
+        self._samplers = {}
+        self._link: Optional[str] = None
+        self._title = ""
+        self._song: Optional[Song] = None
+        self._lyrics: Optional[Lyrics] = None
+        self._no_lyrics_attempts = 0
+        self._available: Optional[Sequence[str]] = None
+        self._translations_for: Optional[Callable[[str], List[str]]] = None
+        self._translations: Optional[List[str]] = None
+        self._quiz: Optional[_Quiz] = None
+
+    # Driving the game
+
+    def take_output(self) -> List[Message]:
+        """Messages queued since the last call, oldest first."""
+        output, self._output = self._output, []
+        return output
+
+    def feed(self, text: str):
+        """The player's reply to `prompt`."""
+        handler = self._on_input
+        if handler is None:
+            raise RuntimeError(f"the game is not waiting for input ({self.state})")
+        self._on_input = None
+        self.prompt = None
+        handler(text)
+
+    def complete(self, result=None):
+        """The result of `work`."""
+        on_done = self._expect_work()
+        if self.done:
+            # Closed while the work ran: release what it built.
+            close = getattr(result, "close", None)
+            if close is not None:
+                close()
+            return
+        on_done(result)
+
+    def fail(self, error: Exception):
+        """`work` raised `error`. Errors the game has no answer for are raised again."""
+        on_error = self._on_error
+        self._expect_work()
+        if self.done:
+            return
+        if on_error is None:
+            self._finish()
+            raise error
+        on_error(error)
+
+    def interrupt(self) -> bool:
+        """
+        The player quit (Ctrl+C), at a prompt or while `work` ran. Returns
+        False when that doesn't end the game cleanly (before it has started),
+        so the driver can stop it its own way.
+        """
+        if self.work is not None:
+            # The work was abandoned: drop it and cancel translations in flight.
+            self._expect_work()
+            self._finish(["Interrupted. Exiting."])
+        elif self.state == INSTRUCTIONS:
+            self._finish(["Interrupted. Exiting."])
+        elif self.state in (TRANSLATE, ANSWER):
+            self._finish("Exiting the game.")
+        else:
+            return False
+        return True
+
+    def close(self):
+        """End the game and cancel translations still in flight."""
+        self.done = True
+        self.state = DONE
+        self.prompt = None
+        self._on_input = None
+        if self._quiz is not None:
+            self._quiz.close()
+
+    # Plumbing
+
+    def _say(self, *messages: Message):
+        self._output.extend(messages)
+
+    def _ask(self, state: str, prompt: str, on_input: Callable[[str], None], span: str = "user input"):
+        self.state = state
+        self.prompt = prompt
+        self.prompt_span = span
+        self._on_input = on_input
+
+    def _wait(self, work: Work, on_done: Callable, on_error: Optional[Callable[[Exception], None]] = None):
+        self.state = work.name
+        self.work = work
+        self._on_done = on_done
+        self._on_error = on_error
+
+    def _expect_work(self) -> Callable:
+        if self.work is None:
+            raise RuntimeError(f"the game is not waiting for work ({self.state})")
+        on_done = self._on_done
+        self.work = self._on_done = self._on_error = None
+        return on_done
+
+    def _finish(self, *messages: Message):
+        self._say(*messages)
+        self.close()
+
+    # Song selection
+
+    def start(self):
+        self._ask(CHOOSE_MODE, "Input (1 or 2): ", self._on_mode)
+
+    def start_with(self, song: Song, lyrics: Lyrics, available: Optional[Sequence[str]] = None,
+                   translations: Optional[Callable[[str], List[str]]] = None):
+        """
+        Play `lyrics` right away. `available` limits the target languages and
+        `translations(code)` gives the answers for every line up front (both
+        from a song pack); otherwise lines are translated as the game goes.
+        """
+        self._song, self._lyrics = song, lyrics
+        self._available = available
+        self._translations_for = translations
+        self._say("", cli.song_announcement(song), "")
+        self._song_found()
+
+    def _on_mode(self, text: str):
+        choice = text.strip()
+        if choice == "2":
+            # Manual entry: ask for title and artist and construct a minimal song
+            self._manual = True
+            self._say([
+                "Search for your song, and make sure to type carefully.",
+                "A random song may be selected if your input is not recognized.",
+            ])
+            self._ask(SONG_TITLE, "Song title: ", self._on_title)
+        elif choice == "1":
+            self._wait(Work("token fetch", spotify_client.get_token), self._on_token)
+        else:
+            self._say(["Invalid input. Please enter 1 or 2."])
+            self._ask(CHOOSE_MODE, "Input (1 or 2): ", self._on_mode)
+
+    def _on_title(self, text: str):
+        self._title = text.strip()
+        self._ask(ARTIST_NAME, "Artist name: ", self._on_artist)
+
+    def _on_artist(self, text: str):
+        artist = text.strip()
+        if not self._title:
+            self._finish(["No song title provided. Exiting."])
+            return
+        self._say("")
+        self._song = Song(self._title, (artist,) if artist else ())
+        self._lyrics = None
+        self._find_lyrics()
+
+    def _on_token(self, token):
+        self._token = token
+        self._say([
+            "How to get the link of a playlist in Spotify:",
+            "",
+            "1. Go to your playlist and press the three dots.",
+            "2. Press 'Share' -> 'Copy playlist link'.",
+        ])
+        self._ask(PLAYLIST_LINK, "Paste your link here: ", self._on_link)
+
+    def _pick(self, link: str, name: str = "pick song", **args) -> Work:
+        # Draws a few songs and checks them for lyrics concurrently. Each game
+        # has its own samplers, so games on the same playlist (on a server)
+        # don't use up each other's songs.
+        token, samplers, warm = self._token, self._samplers, self.warm_playlists
+
+        def pick():
+            playlist_id = spotify_client.extract_playlist_id(link)
+            if playlist_id not in samplers:
+                samplers[playlist_id] = spotify_client.PlaylistSampler(token, link, warm=warm)
+            return resolver.pick_song_with_lyrics(token, link, sampler=samplers[playlist_id])
+
+        return Work(name, pick, **args)
+
+    def _adopt(self, link: str, picked) -> bool:
+        song, lyrics = picked
+        if not song:
+            return False
+        self._link = link
+        self._song, self._lyrics = song, lyrics
+        self._say("", cli.song_announcement(song), "")
+        return True
+
+    def _on_link(self, text: str):
+        # Prompt until a plausible Spotify playlist link/URI is provided and a song can be fetched.
+        link = text.strip()
+        if not link or not is_playlist_link(link):
+            self._say(["Paste a link here. Please try again."] if not link else
+                      ["Invalid Spotify playlist link. Please try again."], "")
+            self._ask(PLAYLIST_LINK, "Paste your link here: ", self._on_link)
+            return
+        self._say(["Choosing a random song from your playlist..."])
+
+        def picked(result):
+            if self._adopt(link, result):
+                self._find_lyrics()
+                return
+            self._say(["Could not find a song in that playlist. Try another playlist link."])
+            self._ask(PLAYLIST_LINK, "Paste your link here: ", self._on_link)
+
+        def failed(e):
+            self._say([
+                f"Error reading playlist: {e}",
+                "Please check the link and your internet connection, then try again."
+            ])
+            self._ask(PLAYLIST_LINK, "Paste your link here: ", self._on_link)
+
+        self._wait(self._pick(link), picked, failed)
+
+    def _find_lyrics(self):
+        # The playlist resolver already looked the song up; only search here
+        # for manual entries or when the resolver's lookups failed.
+        if self._lyrics is not None:
+            self._on_lyrics(self._lyrics)
+            return
+        if self._manual:
+            self._say("Searching for your song...")
+        song = self._song
+        self._wait(Work("lyrics search", lambda: genius_client.get_song_lyrics(song.title, song.artist)),
+                   self._on_lyrics, self._on_lyrics_error)
+
+    def _on_lyrics_error(self, e: Exception):
+        # Transient timeouts and rate limits were already retried with backoff
+        # by the shared api transport. Imported here rather than at the top so
+        # startup doesn't pay for it; the api clients have loaded it by now.
+        import requests
+
+        if isinstance(e, requests.exceptions.Timeout):
+            self._finish(["Search timed out after multiple attempts. Please check your internet connection and try again later."])
+        elif isinstance(e, requests.exceptions.RequestException):
+            self._finish([f"Network error while searching for song: {e}"])
+        else:
+            # Unexpected error from the lyrics provider; show a friendly message.
+            self._finish([f"Error while searching for song: {e}"])
+
+    def _on_lyrics(self, lyrics: Optional[Lyrics]):
+        self._lyrics = lyrics
+        if resolver.has_lyrics(lyrics):
+            self._song_found()
+            return
+        if self._manual:
+            # Nothing returned at all means the song was not found; found
+            # without a lyrics body means there are no lyrics.
+            self._finish(["no song named that found"] if lyrics is None else ["no lyrics, quitting"])
+            return
+
+        # Playlist flow: try a few other random songs from the same playlist,
+        # then ask for another playlist.
+        self._say([f"{cli.song_name(self._song, lyrics)} has no lyrics. Choosing another random song..."])
+        self._no_lyrics_attempts += 1
+        if self._no_lyrics_attempts >= MAX_NO_LYRICS_ATTEMPTS:
+            self._say(["Tried several songs in this playlist but couldn't find lyrics."],
+                      ["Please paste another playlist link (or press ENTER to exit):"], "")
+            self._ask(NEW_PLAYLIST_LINK, "link: ", self._on_new_link)
+            return
+
+        def picked(result):
+            if not self._adopt(self._link, result):
+                self._finish(["Could not find another song in the playlist. Exiting."])
+                return
+            self._find_lyrics()
+
+        def failed(e):
+            self._finish([f"Error selecting another song from playlist: {e}"])
+
+        self._wait(self._pick(self._link, "no-lyrics re-pick", attempt=self._no_lyrics_attempts), picked, failed)
+
+    def _on_new_link(self, text: str):
+        link = text.strip()
+        if not link:
+            self._finish(["No new playlist provided. Exiting."])
+            return
+        if not is_playlist_link(link):
+            self._say(["Invalid Spotify playlist link. Please try again or press ENTER to quit."], "")
+            self._ask(NEW_PLAYLIST_LINK, "link: ", self._on_new_link)
+            return
+
+        def picked(result):
+            if self._adopt(link, result):
+                # Adopt the new playlist and reset attempts
+                self._no_lyrics_attempts = 0
+                self._find_lyrics()
+                return
+            self._say(["Could not find a song in that playlist. Try another playlist link or press ENTER to quit."], "")
+            self._ask(NEW_PLAYLIST_LINK, "link: ", self._on_new_link)
+
+        def failed(e):
+            self._say([f"Error reading new playlist: {e}"], ["Please try another link or press ENTER to quit."], "")
+            self._ask(NEW_PLAYLIST_LINK, "link: ", self._on_new_link)
+
+        self._wait(self._pick(link, playlist="new"), picked, failed)
+
+    # Language choice
+
+    def _song_found(self):
+        # Show the song with the provider's canonical title and artist.
+        self._say("", [f"Your song is: {cli.song_name(self._song, self._lyrics)}"], "")
+        available = self._available
+        self._say([
+            "What language do you want to translate the song to?",
+            "",
+            "e.g english, swedish, spanish..." if available is None else
+            "This pack has: " + ", ".join(translate_client.code_to_display_name(c) for c in available),
+        ], "")
+        self._ask(LANGUAGE, "Language: ", self._on_language)
+
+    def _ask_language_again(self, *messages: Message):
+        self._say(*messages, "")
+        self._ask(LANGUAGE, "Language: ", self._on_language)
+
+    def _on_language(self, text: str):
+        user_lang = text.strip()
+        self._say("")
+        # convert language name like "english" -> "en" using translate_client helper
+        with tracing.span("language resolution"):
+            code = translate_client.language_name_to_code(user_lang)
+        if self._available is not None:
+            # also accept the pack's own codes as typed, e.g. "zh-CN"
+            code = code if code in self._available else user_lang
+            if code not in self._available:
+                self._ask_language_again([f"'{user_lang}' is not in this pack, please choose one of its languages."])
+                return
+        elif not code:
+            # ambiguous ("chi") or a typo too far off: offer the closest names
+            suggestions = [candidate.name for candidate in languages.resolve(user_lang, limit=4)]
+            if suggestions:
+                self._ask_language_again([f"'{user_lang}' could be: {', '.join(suggestions)}. Which one?"])
+                return
+            self._say([f"'{user_lang}' is an unknown language, defaulting to English."], "")
+            code = "en"
+        self._start_quiz(code)
+
+    # The line loop
+
+    def _start_quiz(self, code: str):
+        lyrics = self._lyrics
+        if self._translations_for is not None:
+            self._translations = self._translations_for(code)
+        prefetch = self._translations is None
+        executor = self.prefetch_executor
+        self._wait(Work("quiz setup", lambda: _build_quiz(lyrics, code, prefetch, executor)),
+                   lambda quiz: self._on_quiz(quiz, code))
+
+    def _on_quiz(self, quiz: _Quiz, code: str):
+        self._quiz = quiz
+        if quiz.already_translated:
+            self._say([f"This song is already in {translate_client.code_to_display_name(code)}, nothing to translate!"], "")
+        self._say(INSTRUCTIONS_TEXT, [
+            "Press ENTER whenever you are ready to start!",
+            "Remember that translations may be inaccurate.",
+        ])
+        self._ask(INSTRUCTIONS, "", lambda _: self._show_line(0), "read instructions")
+
+    def _show_line(self, index: int):
+        if index >= len(self._quiz.lines):
+            self.close()
+            return
+        self._say([f"Original: {self._quiz.lines[index]}"])
+        self._ask(TRANSLATE, "Translate: ", lambda text: self._on_translation(index, text.strip()), "think")
+
+    def _on_translation(self, index: int, answer: str):
+        if self._translations is not None:
+            self._on_expected(index, answer, self._translations[self._quiz.order[index]])
+            return
+        # Prefetched while the player was typing, so this rarely waits.
+        prefetcher = self._quiz.prefetcher
+        self._wait(Work("translate wait", lambda: prefetcher.get(index), line=index),
+                   lambda expected: self._on_expected(index, answer, expected),
+                   lambda e: self._on_no_translation(index, answer, e))
+
+    def _on_expected(self, index: int, answer: str, expected: str):
+        self.answers.append((self._quiz.lines[index], answer, expected))
+        self._say([f"Answer: {expected}"])
+        # Wait for ENTER before the next line: translate -> see the answer -> next line.
+        self._ask(ANSWER, "", lambda _: self._show_line(index + 1), "read answer")
+
+    def _on_no_translation(self, index: int, answer: str, error: Exception):
+        # Say so rather than show the original line as the answer.
+        if isinstance(error, translate_client.Throttled):
+            reason = "rate limited by the translator"
+        else:
+            reason = "the translator failed"
+        self.answers.append((self._quiz.lines[index], answer, None))
+        self._say([f"Answer: not available ({reason})."])
+        self._ask(ANSWER, "", lambda _: self._show_line(index + 1), "read answer")
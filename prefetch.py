@@ -0,0 +1,153 @@
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import api.translate as translate_client
+from api import config
+
+# How many lines ahead of the current one we keep translating in the
+# background, and how many worker threads do the translating.
+DEFAULT_WINDOW = 5
+DEFAULT_WORKERS = 4
+
+# "paragraph" translates each paragraph in one request and aligns the result
+# back to its lines; "line" sends every line on its own.
+TRANSLATE_MODES = ("paragraph", "line")
+DEFAULT_TRANSLATE_MODE = "paragraph"
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return max(1, int(config.getenv(name, default)))
+    except (TypeError, ValueError):
+        return default
+
+
+def translate_line(line: str, target_language: str) -> str:
+    """
+    Translate a single lyrics line and return only the translated text.
+    Raises if the translator fails (see translate_client.TranslationError).
+    """
+    return translate_client._translate_paragraph(line, target_language)
+
+
+def translate_paragraph(lines: List[str], target_language: str) -> List[str]:
+    """Translate the lines of a paragraph together, one translation per line. Raises if the translator fails."""
+    return translate_client.translate_paragraph_lines(lines, target_language)
+
+
+def translate_mode() -> str:
+    mode = (config.getenv("LYRINGO_TRANSLATE_MODE") or DEFAULT_TRANSLATE_MODE).strip().lower()
+    return mode if mode in TRANSLATE_MODES else DEFAULT_TRANSLATE_MODE
+
+
+class TranslationPrefetcher:
+    """
+    Translates the lines of a song ahead of the player.
+
+    As soon as the target language is known the first `window` lines are
+    submitted to a worker pool. Every call to `get(i)` tops the window up to
+    `i + window` and then waits for line `i`, which by then is usually done.
+
+    When `paragraphs` is given (and the mode is "paragraph"), the unit of work
+    is a whole paragraph: it is translated in one request and its lines are
+    answered from that result. Identical paragraphs, like a repeated chorus,
+    share a single translation.
+
+    Pass `executor` to share one worker pool between many prefetchers (the
+    game server does); otherwise each prefetcher starts its own.
+
+    Use as a context manager (or call `close()`) so that pending work is
+    cancelled when the game ends early.
+    """
+
+    def __init__(
+        self,
+        lines: Sequence[str],
+        target_language: str,
+        window: Optional[int] = None,
+        workers: Optional[int] = None,
+        translate: Callable[[str, str], str] = translate_line,
+        paragraphs: Optional[Sequence[Sequence[str]]] = None,
+        translate_paragraph: Callable[[List[str], str], List[str]] = translate_paragraph,
+        executor: Optional[Executor] = None,
+    ):
+        self.lines = lines
+        self.target_language = target_language
+        self.window = window or _env_int("LYRINGO_PREFETCH_WINDOW", DEFAULT_WINDOW)
+        workers = workers or _env_int("LYRINGO_PREFETCH_WORKERS", DEFAULT_WORKERS)
+        self._translate = translate
+        self._translate_paragraph = translate_paragraph
+        self._owns_executor = executor is None
+        self._executor = executor or ThreadPoolExecutor(max_workers=workers, thread_name_prefix="lyringo-prefetch")
+        self._closed = False
+
+        # Work is done in units of lines: one line each, or one paragraph each.
+        if paragraphs is None or translate_mode() == "line":
+            self._units: Sequence[Sequence[str]] = [[line] for line in lines]
+        else:
+            self._units = paragraphs
+        # line index -> (unit, position in unit), and unit -> first line index
+        self._where: List[Tuple[int, int]] = []
+        self._starts: List[int] = []
+        for u, unit in enumerate(self._units):
+            self._starts.append(len(self._where))
+            self._where.extend((u, pos) for pos in range(len(unit)))
+        if len(self._where) != len(lines):
+            raise ValueError("paragraphs do not add up to the given lines")
+
+        # Identical units share one future.
+        self._futures: Dict[Tuple[str, ...], Future] = {}
+        self._next = 0
+        self._fill(0)
+
+    def _run(self, unit: Sequence[str]) -> List[str]:
+        if len(unit) == 1:
+            return [self._translate(unit[0], self.target_language)]
+        return self._translate_paragraph(list(unit), self.target_language)
+
+    def _fill(self, current: int):
+        # Submit every unit starting at or before `current + window` that isn't queued yet.
+        end = current + self.window
+        while self._next < len(self._units) and self._starts[self._next] <= end and not self._closed:
+            unit = self._units[self._next]
+            key = tuple(unit)
+            if key not in self._futures:
+                self._futures[key] = self._executor.submit(self._run, unit)
+            self._next += 1
+
+    def get(self, index: int) -> str:
+        """
+        Return the translation of line `index`, waiting for it if needed.
+        Raises the translator's error when it failed; the next get() of a
+        line of the same unit tries again.
+        """
+        self._fill(index)
+        u, pos = self._where[index]
+        unit = self._units[u]
+        key = tuple(unit)
+        future = self._futures.get(key)
+        if future is None:
+            # Cancelled after close(): translate inline.
+            return self._run(unit)[pos]
+        try:
+            return future.result()[pos]
+        except Exception:
+            if self._futures.get(key) is future:
+                del self._futures[key]
+            raise
+
+    def close(self):
+        """Cancel queued translations and stop the worker pool (if it is ours) without waiting."""
+        self._closed = True
+        for future in self._futures.values():
+            future.cancel()
+        self._futures.clear()
+        if self._owns_executor:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
@@ -0,0 +1,78 @@
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Optional, Tuple
+
+import api.genius as genius_client
+import api.spotify as spotify_client
+from api import config, tracing
+from api.models import Lyrics, Song
+
+# How many playlist songs are checked for lyrics at the same time.
+DEFAULT_CANDIDATES = 3
+
+
+def _candidates() -> int:
+    try:
+        return max(1, int(config.getenv("LYRINGO_LYRICS_CANDIDATES", DEFAULT_CANDIDATES)))
+    except ValueError:
+        return DEFAULT_CANDIDATES
+
+
+def has_lyrics(lyrics: Optional[Lyrics]) -> bool:
+    """True if a get_song_lyrics result has a non-empty lyrics body."""
+    return lyrics is not None and lyrics.has_lyrics
+
+
+def _known_without_lyrics(song: Song) -> bool:
+    return genius_client.is_known_without_lyrics(song.title, song.artist)
+
+
+def _lookup(song: Song) -> Optional[Lyrics]:
+    with tracing.span("lyrics search", track=song.title):
+        return genius_client.get_song_lyrics(song.title, song.artist)
+
+
+def pick_song_with_lyrics(token, playlist_link, k: Optional[int] = None,
+                          sampler=None) -> Tuple[Optional[Song], Optional[Lyrics]]:
+    """
+    Draw k unseen random songs from a playlist, look all of them up on Genius
+    at once and return (song, lyrics) for the first one that has lyrics.
+    The remaining lookups are cancelled (or, if already running, left to
+    finish in the background where they still fill the lyrics cache).
+    Nothing is printed; announcing the pick is up to the caller.
+
+    Songs are drawn from `sampler` (a spotify_client.PlaylistSampler), by
+    default the process-wide one for the playlist.
+
+    If no candidate has lyrics, the last candidate is returned with its
+    empty result so the caller can report it. If every lookup failed, the
+    first candidate is returned with lyrics None so the caller fetches
+    it itself and reports the error. (None, None) means the playlist has no
+    songs left to try.
+    """
+    k = k or _candidates()
+    # Never re-draw a song this session and skip songs we already know have
+    # no lyrics before spending a Genius search on them.
+    with tracing.span("playlist read"):
+        sampler = sampler or spotify_client.playlist_sampler(token, playlist_link)
+        songs = sampler.draw(k, skip=_known_without_lyrics)
+    if not songs:
+        return None, None
+
+    executor = ThreadPoolExecutor(max_workers=len(songs), thread_name_prefix="lyringo-probe")
+    try:
+        pending = {executor.submit(_lookup, song): song for song in songs}
+        fallback = (songs[0], None)
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                song = pending.pop(future)
+                try:
+                    lyrics = future.result()
+                except Exception:
+                    continue
+                if has_lyrics(lyrics):
+                    return song, lyrics
+                fallback = (song, lyrics)
+        return fallback
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
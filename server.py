@@ -0,0 +1,516 @@
+"""
+Serve Lyringo games over HTTP and WebSocket, to many players at once.
+
+Every game is a game.Game; all of them share the api clients with their
+caches and connection pools. The event loop only moves games along: the
+blocking upstream calls a game waits on run on a bounded thread pool, and
+lyrics lines are translated ahead on a second pool shared by all games.
+
+    python server.py --port 8765 --workers 32
+    # then open http://127.0.0.1:8765/
+
+WebSocket, GET /ws: one game per connection. Whenever the game needs the
+player, the server sends a screen
+
+    {"session": "...", "state": "language", "messages": [...], "prompt": "Language: ", "done": false}
+
+where a message is a line of text or a list of lines shown in a box. The
+client answers with {"input": "swedish"} (or just the text), or quits with
+{"quit": true}.
+
+HTTP: POST /sessions starts a game and returns its first screen,
+POST /sessions/<id> with {"input": "..."} answers it and returns the next
+one, DELETE /sessions/<id> ends it, GET /health shows sessions and pool use.
+"""
+import argparse
+import asyncio
+import base64
+import contextlib
+import hashlib
+import json
+import os
+import struct
+import sys
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlsplit
+
+import cli
+from api import metrics
+from game import Game
+
+DEFAULT_WORKERS = 32
+DEFAULT_TRANSLATE_WORKERS = 16
+DEFAULT_MAX_SESSIONS = 1000
+# Games nobody has answered for this long are ended.
+DEFAULT_IDLE_TIMEOUT = 30 * 60
+
+MAX_HEADER_BYTES = 16 * 1024
+MAX_BODY_BYTES = 64 * 1024
+
+WEBSOCKET_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+OP_CONTINUATION = 0x0
+OP_TEXT = 0x1
+OP_BINARY = 0x2
+OP_CLOSE = 0x8
+OP_PING = 0x9
+OP_PONG = 0xA
+
+STATUS_TEXT = {200: "OK", 201: "Created", 204: "No Content", 400: "Bad Request", 404: "Not Found",
+               405: "Method Not Allowed", 413: "Payload Too Large", 503: "Service Unavailable"}
+
+INDEX_HTML = """<!doctype html>
+<meta charset="utf-8">
+<title>Lyringo</title>
+<style>
+  body { font: 16px/1.4 monospace; max-width: 44em; margin: 2em auto; }
+  .box { border: 1px solid #888; padding: .5em 1em; margin: .5em 0; white-space: pre-wrap; }
+  #prompt { font-weight: bold; }
+  input { font: inherit; width: 30em; }
+</style>
+<div id="out"></div>
+<form id="form"><span id="prompt"></span> <input id="input" autocomplete="off" autofocus></form>
+<script>
+  const out = document.getElementById("out"), input = document.getElementById("input");
+  const ws = new WebSocket((location.protocol === "https:" ? "wss://" : "ws://") + location.host + "/ws");
+  ws.onmessage = (event) => {
+    const screen = JSON.parse(event.data);
+    for (const message of screen.messages) {
+      const el = document.createElement("div");
+      if (Array.isArray(message)) { el.className = "box"; el.textContent = message.join("\\n"); }
+      else { el.textContent = message || "\\u00a0"; }
+      out.appendChild(el);
+    }
+    document.getElementById("prompt").textContent = screen.done ? "Thanks for playing!" : screen.prompt;
+    input.disabled = screen.done;
+    window.scrollTo(0, document.body.scrollHeight);
+  };
+  document.getElementById("form").onsubmit = (event) => {
+    event.preventDefault();
+    ws.send(JSON.stringify({input: input.value}));
+    input.value = "";
+  };
+</script>
+"""
+
+
+class HttpError(Exception):
+    def __init__(self, status: int, message: str = ""):
+        super().__init__(message or STATUS_TEXT.get(status, ""))
+        self.status = status
+
+
+class BoundedExecutor:
+    """
+    A thread pool for blocking calls with a cap on how many are handed to it
+    at once. Calls over the cap wait on the event loop instead of in the
+    pool's queue, where they could no longer be cancelled when their player
+    disconnects.
+    """
+
+    def __init__(self, workers: int, max_pending: Optional[int] = None):
+        self.workers = workers
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="lyringo-server")
+        self._slots = asyncio.Semaphore(max_pending or workers * 2)
+        self.running = 0
+        self.waiting = 0
+
+    async def run(self, fn):
+        self.waiting += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self.waiting -= 1
+        self.running += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._pool, fn)
+        finally:
+            self.running -= 1
+            self._slots.release()
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+class Session:
+    """One player's game on the server. Only ever touched from the event loop."""
+
+    def __init__(self, server: "GameServer"):
+        self.id = uuid.uuid4().hex
+        # No playlist warm-up: a full read per new playlist would add bursts of
+        # Spotify requests on top of every game's own picks.
+        self.game = Game(prefetch_executor=server.translate_pool, warm_playlists=False)
+        self.last_active = time.monotonic()
+        self._server = server
+        self._lock = asyncio.Lock()
+
+    def screen(self, *messages) -> dict:
+        game = self.game
+        return {
+            "session": self.id,
+            "state": game.state,
+            "messages": [*messages, *game.take_output()],
+            "prompt": game.prompt,
+            "done": game.done,
+        }
+
+    async def begin(self) -> dict:
+        self.game.start()
+        return self.screen(cli.WELCOME_TEXT, cli.CHOICES_TEXT)
+
+    async def answer(self, text: str) -> dict:
+        """Feed the player's reply and run the game until it needs them again."""
+        async with self._lock:
+            self.last_active = time.monotonic()
+            game = self.game
+            if not game.done:
+                game.feed(text)
+            while game.work is not None and not game.done:
+                work = game.work
+                try:
+                    result = await self._server.executor.run(work)
+                except Exception as e:
+                    try:
+                        game.fail(e)
+                    except Exception as unhandled:
+                        return self.screen([f"Something went wrong: {unhandled}", "Please try again later."])
+                else:
+                    game.complete(result)
+            return self.screen()
+
+    def quit(self) -> dict:
+        if not self.game.interrupt():
+            self.game.close()
+        return self.screen()
+
+
+class GameServer:
+    def __init__(self, workers: int = DEFAULT_WORKERS, translate_workers: int = DEFAULT_TRANSLATE_WORKERS,
+                 max_sessions: int = DEFAULT_MAX_SESSIONS, idle_timeout: float = DEFAULT_IDLE_TIMEOUT):
+        self.workers = workers
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.translate_pool = ThreadPoolExecutor(max_workers=translate_workers, thread_name_prefix="lyringo-prefetch")
+        self.executor: Optional[BoundedExecutor] = None
+        self.sessions: Dict[str, Session] = {}
+        self.started_sessions = 0
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._reaper: Optional[asyncio.Task] = None
+
+    async def start(self, host: str = "127.0.0.1", port: int = 8765) -> Tuple[str, int]:
+        """Start listening; returns the bound (host, port), so port 0 picks a free one."""
+        self.executor = BoundedExecutor(self.workers)
+        self._server = await asyncio.start_server(self._handle, host, port, limit=MAX_HEADER_BYTES)
+        self._reaper = asyncio.create_task(self._reap_idle())
+        return self._server.sockets[0].getsockname()[:2]
+
+    async def serve_forever(self):
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def close(self):
+        if self._reaper is not None:
+            self._reaper.cancel()
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        for session in list(self.sessions.values()):
+            self._end(session)
+        self.executor.shutdown()
+        self.translate_pool.shutdown(wait=False, cancel_futures=True)
+
+    # Sessions
+
+    def _new_session(self) -> Session:
+        if len(self.sessions) >= self.max_sessions:
+            raise HttpError(503, "too many games in progress, try again later")
+        session = Session(self)
+        self.sessions[session.id] = session
+        self.started_sessions += 1
+        return session
+
+    def _end(self, session: Session):
+        session.game.close()
+        self.sessions.pop(session.id, None)
+
+    async def _reap_idle(self):
+        while True:
+            await asyncio.sleep(min(60.0, self.idle_timeout))
+            cutoff = time.monotonic() - self.idle_timeout
+            for session in [s for s in self.sessions.values() if s.last_active < cutoff]:
+                self._end(session)
+
+    def health(self) -> dict:
+        return {
+            "sessions": len(self.sessions),
+            "started_sessions": self.started_sessions,
+            "workers": self.workers,
+            "running": self.executor.running,
+            "waiting": self.executor.waiting,
+        }
+
+    # HTTP
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                try:
+                    request = await _read_request(reader)
+                except HttpError as e:
+                    _write_response(writer, e.status, {"error": str(e)}, keep_alive=False)
+                    break
+                if request is None:
+                    break
+                method, path, headers, body = request
+                if path == "/ws" and headers.get("upgrade", "").lower() == "websocket":
+                    await self._websocket(reader, writer, headers)
+                    break
+                keep_alive = headers.get("connection", "").lower() != "close"
+                try:
+                    status, payload = await self._route(method, path, body)
+                except HttpError as e:
+                    status, payload = e.status, {"error": str(e)}
+                _write_response(writer, status, payload, keep_alive=keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+            with contextlib.suppress(Exception):
+                await writer.wait_closed()
+
+    async def _route(self, method: str, path: str, body: bytes):
+        if path == "/":
+            _allow(method, "GET")
+            return 200, INDEX_HTML
+        if path == "/health":
+            _allow(method, "GET")
+            return 200, self.health()
+        if path == "/sessions":
+            _allow(method, "POST")
+            session = self._new_session()
+            return 201, await session.begin()
+        if path.startswith("/sessions/"):
+            session = self.sessions.get(path[len("/sessions/"):])
+            if session is None:
+                raise HttpError(404, "no such game")
+            _allow(method, "POST", "DELETE")
+            if method == "DELETE":
+                self._end(session)
+                return 204, None
+            text, quit = _parse_input(body.decode("utf-8", "replace"))
+            screen = session.quit() if quit else await session.answer(text)
+            if screen["done"]:
+                self._end(session)
+            return 200, screen
+        raise HttpError(404)
+
+    # WebSocket
+
+    async def _websocket(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, headers: Dict[str, str]):
+        key = headers.get("sec-websocket-key")
+        if not key:
+            _write_response(writer, 400, {"error": "missing Sec-WebSocket-Key"}, keep_alive=False)
+            return
+        accept = base64.b64encode(hashlib.sha1((key + WEBSOCKET_GUID).encode("ascii")).digest()).decode("ascii")
+        writer.write((
+            "HTTP/1.1 101 Switching Protocols\r\n"
+            "Upgrade: websocket\r\n"
+            "Connection: Upgrade\r\n"
+            f"Sec-WebSocket-Accept: {accept}\r\n\r\n"
+        ).encode("ascii"))
+        try:
+            session = self._new_session()
+        except HttpError:
+            # 1013: try again later
+            writer.write(encode_frame(OP_CLOSE, struct.pack("!H", 1013)))
+            await writer.drain()
+            return
+        try:
+            await _send_json(writer, await session.begin())
+            while not session.game.done:
+                message = await read_message(reader, writer)
+                if message is None:
+                    break
+                text, quit = _parse_input(message)
+                await _send_json(writer, session.quit() if quit else await session.answer(text))
+            writer.write(encode_frame(OP_CLOSE, struct.pack("!H", 1000)))
+            await writer.drain()
+        finally:
+            self._end(session)
+
+
+def _allow(method: str, *allowed: str):
+    if method not in allowed:
+        raise HttpError(405)
+
+
+def _parse_input(message: str) -> Tuple[str, bool]:
+    """(text, quit) from {"input": ...} / {"quit": true}, or the message itself as the text."""
+    try:
+        data = json.loads(message)
+    except ValueError:
+        return message, False
+    if not isinstance(data, dict):
+        return message, False
+    return str(data.get("input") or ""), bool(data.get("quit"))
+
+
+async def _read_request(reader: asyncio.StreamReader):
+    """(method, path, headers, body) of the next request, or None when the client is gone."""
+    try:
+        head = await reader.readuntil(b"\r\n\r\n")
+    except asyncio.IncompleteReadError as e:
+        if e.partial.strip():
+            raise HttpError(400, "incomplete request")
+        return None
+    except asyncio.LimitOverrunError:
+        raise HttpError(400, "headers too large")
+    request_line, *header_lines = head.decode("latin-1").split("\r\n")
+    try:
+        method, target, _ = request_line.split(" ", 2)
+    except ValueError:
+        raise HttpError(400, "malformed request line")
+    headers = {}
+    for line in header_lines:
+        name, sep, value = line.partition(":")
+        if sep:
+            headers[name.strip().lower()] = value.strip()
+    try:
+        length = int(headers.get("content-length") or 0)
+    except ValueError:
+        raise HttpError(400, "bad Content-Length")
+    if length > MAX_BODY_BYTES:
+        raise HttpError(413)
+    body = await reader.readexactly(length) if length else b""
+    return method.upper(), urlsplit(target).path, headers, body
+
+
+def _write_response(writer: asyncio.StreamWriter, status: int, payload, keep_alive: bool = True):
+    if payload is None:
+        body, content_type = b"", None
+    elif isinstance(payload, str):
+        body, content_type = payload.encode("utf-8"), "text/html; charset=utf-8"
+    else:
+        body, content_type = json.dumps(payload, ensure_ascii=False).encode("utf-8"), "application/json"
+    head = [f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}", f"Content-Length: {len(body)}",
+            f"Connection: {'keep-alive' if keep_alive else 'close'}"]
+    if content_type:
+        head.append(f"Content-Type: {content_type}")
+    writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + body)
+
+
+# WebSocket framing (RFC 6455). Also used by bench/server_load.py as a client,
+# which is why masking works both ways.
+
+def _mask(payload: bytes, key: bytes) -> bytes:
+    if not payload:
+        return payload
+    repeated = (key * (len(payload) // 4 + 1))[:len(payload)]
+    return (int.from_bytes(payload, "big") ^ int.from_bytes(repeated, "big")).to_bytes(len(payload), "big")
+
+
+def encode_frame(opcode: int, payload: bytes, mask: bool = False) -> bytes:
+    """One final frame. Clients must mask what they send; servers must not."""
+    head = bytearray([0x80 | opcode])
+    mask_bit = 0x80 if mask else 0
+    if len(payload) < 126:
+        head.append(mask_bit | len(payload))
+    elif len(payload) < 1 << 16:
+        head.append(mask_bit | 126)
+        head += struct.pack("!H", len(payload))
+    else:
+        head.append(mask_bit | 127)
+        head += struct.pack("!Q", len(payload))
+    if mask:
+        key = os.urandom(4)
+        head += key
+        payload = _mask(payload, key)
+    return bytes(head) + payload
+
+
+async def read_frame(reader: asyncio.StreamReader) -> Tuple[bool, int, bytes]:
+    """(final, opcode, payload) of the next frame, unmasked."""
+    first, second = await reader.readexactly(2)
+    length = second & 0x7F
+    if length == 126:
+        length = struct.unpack("!H", await reader.readexactly(2))[0]
+    elif length == 127:
+        length = struct.unpack("!Q", await reader.readexactly(8))[0]
+    if length > MAX_BODY_BYTES:
+        raise ConnectionError("websocket frame too large")
+    key = await reader.readexactly(4) if second & 0x80 else None
+    payload = await reader.readexactly(length)
+    return bool(first & 0x80), first & 0x0F, _mask(payload, key) if key else payload
+
+
+async def read_message(reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                       mask: bool = False) -> Optional[str]:
+    """
+    The next text message, answering pings on the way. None once the other
+    side closes the connection.
+    """
+    parts = []
+    while True:
+        final, opcode, payload = await read_frame(reader)
+        if opcode == OP_PING:
+            writer.write(encode_frame(OP_PONG, payload, mask))
+            continue
+        if opcode == OP_PONG:
+            continue
+        if opcode == OP_CLOSE:
+            return None
+        parts.append(payload)
+        if sum(len(part) for part in parts) > MAX_BODY_BYTES:
+            raise ConnectionError("websocket message too large")
+        if final:
+            return b"".join(parts).decode("utf-8", "replace")
+
+
+async def _send_json(writer: asyncio.StreamWriter, data: dict):
+    writer.write(encode_frame(OP_TEXT, json.dumps(data, ensure_ascii=False).encode("utf-8")))
+    await writer.drain()
+
+
+async def serve(args):
+    server = GameServer(args.workers, args.translate_workers, args.max_sessions, args.idle_timeout)
+    host, port = await server.start(args.host, args.port)
+    print(f"serving Lyringo on http://{host}:{port}/", file=sys.stderr)
+    try:
+        await server.serve_forever()
+    finally:
+        await server.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                        help="threads for blocking upstream calls (lyrics searches, playlist reads, ...)")
+    parser.add_argument("--translate-workers", type=int, default=DEFAULT_TRANSLATE_WORKERS,
+                        help="threads translating lines ahead of the players, shared by all games")
+    parser.add_argument("--max-sessions", type=int, default=DEFAULT_MAX_SESSIONS,
+                        help="games in progress at once; more are turned away")
+    parser.add_argument("--idle-timeout", type=float, default=DEFAULT_IDLE_TIMEOUT,
+                        help="seconds without an answer before a game is ended")
+    parser.add_argument("--metrics", nargs="?", const="summary", choices=metrics.FORMATS,
+                        help="report upstream call counts and latencies on exit")
+    args = parser.parse_args(argv)
+
+    if args.metrics:
+        metrics.enable(args.metrics)
+    else:
+        metrics.enable_from_env()
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,339 @@
+"""
+Song packs: lyrics for many songs plus their translations into several
+languages in one file, so a game can be played without any network access.
+
+    python songpack.py build classroom.lyrpack --playlist LINK --languages en,sv --limit 50
+    python songpack.py build road.lyrpack --song "Bailando - Enrique Iglesias" --languages en
+    python songpack.py info classroom.lyrpack
+    python main.py --pack classroom.lyrpack
+
+File layout (little endian). Every table has fixed-size records, so the file
+is memory-mapped and a single song or line is read with a couple of
+struct.unpack_from calls, without parsing the rest of the file:
+
+    header    magic "LYRPACK1", version u16, language count u16, song count u32,
+              line count u32, then u64 offsets of the language, song, line
+              and text sections
+    languages one 8-byte, NUL padded code per target language
+    songs     per song: title, artist and language as (offset u32, length u32)
+              into the text section, then first line u32 and line count u32
+    lines     per line: a flags byte (1 = starts a paragraph), then
+              (offset u32, length u32) for the original text and for each
+              language in order
+    text      UTF-8 strings, each stored once
+"""
+import argparse
+import mmap
+import os
+import struct
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from api import languages
+from api.models import Lyrics, Song
+
+MAGIC = b"LYRPACK1"
+VERSION = 1
+
+_HEADER = struct.Struct("<8sHHIIQQQQ")
+_LANGUAGE = struct.Struct("<8s")
+_SONG = struct.Struct("<IIIIIIII")
+_REF = struct.Struct("<II")
+
+PARAGRAPH_START = 1
+
+# Lyrics lookups run in parallel while building.
+BUILD_WORKERS = 4
+
+
+class PackError(ValueError):
+    pass
+
+
+class SongPack:
+    """
+    A read-only, memory-mapped song pack. Songs are numbered 0..len(pack)-1;
+    lines are numbered within their song, like Lyrics.lines.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        try:
+            with open(path, "rb") as f:
+                if os.fstat(f.fileno()).st_size == 0:
+                    raise PackError(f"{path} is empty, not a song pack")
+                self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except OSError as e:
+            raise PackError(f"cannot open song pack {path}: {e.strerror or e}") from e
+        try:
+            if len(self._map) < _HEADER.size:
+                raise PackError(f"{path} is not a song pack")
+            (magic, version, n_languages, self._n_songs, self._n_lines,
+             languages_at, self._songs_at, self._lines_at, self._text_at) = _HEADER.unpack_from(self._map, 0)
+            if magic != MAGIC:
+                raise PackError(f"{path} is not a song pack")
+            if version != VERSION:
+                raise PackError(f"{path} is a version {version} pack, expected version {VERSION}")
+            self._line_size = 1 + _REF.size * (1 + n_languages)
+            # Every table must fit in the file, so reading a record never runs
+            # off the end of a truncated pack.
+            size = len(self._map)
+            sections = (
+                (languages_at, n_languages * _LANGUAGE.size),
+                (self._songs_at, self._n_songs * _SONG.size),
+                (self._lines_at, self._n_lines * self._line_size),
+                (self._text_at, 0),
+            )
+            for at, length in sections:
+                if not _HEADER.size <= at <= size - length:
+                    raise PackError(f"{path} is truncated or damaged")
+            self.languages: Tuple[str, ...] = tuple(
+                _LANGUAGE.unpack_from(self._map, languages_at + i * _LANGUAGE.size)[0].rstrip(b"\0").decode("ascii")
+                for i in range(n_languages)
+            )
+        except UnicodeDecodeError as e:
+            self._map.close()
+            raise PackError(f"{path} is truncated or damaged") from e
+        except Exception:
+            self._map.close()
+            raise
+
+    def __len__(self) -> int:
+        return self._n_songs
+
+    def close(self):
+        self._map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    def _text(self, offset: int, length: int) -> str:
+        start = self._text_at + offset
+        if start + length > len(self._map):
+            raise PackError(f"{self.path} is truncated or damaged")
+        try:
+            return str(self._map[start:start + length], "utf-8")
+        except UnicodeDecodeError as e:
+            raise PackError(f"{self.path} is truncated or damaged") from e
+
+    def _song_record(self, index: int):
+        if not 0 <= index < self._n_songs:
+            raise IndexError(f"song {index} is not in the pack")
+        record = _SONG.unpack_from(self._map, self._songs_at + index * _SONG.size)
+        first, count = record[6:]
+        if first + count > self._n_lines:
+            raise PackError(f"{self.path} is truncated or damaged")
+        return record
+
+    def _line_at(self, song_index: int, line: int) -> int:
+        first, count = self._song_record(song_index)[6:]
+        if not 0 <= line < count:
+            raise IndexError(f"line {line} is not in song {song_index}")
+        return self._lines_at + (first + line) * self._line_size
+
+    def song(self, index: int) -> Song:
+        title_at, title_len, artist_at, artist_len = self._song_record(index)[:4]
+        artist = self._text(artist_at, artist_len)
+        return Song(self._text(title_at, title_len), (artist,) if artist else ())
+
+    def line_count(self, index: int) -> int:
+        return self._song_record(index)[7]
+
+    def line(self, song_index: int, line: int, language: Optional[str] = None) -> str:
+        """One line of a song: the original, or its translation into `language`."""
+        column = 0 if language is None else 1 + self._column(language)
+        at = self._line_at(song_index, line) + 1 + column * _REF.size
+        return self._text(*_REF.unpack_from(self._map, at))
+
+    def _column(self, language: str) -> int:
+        try:
+            return self.languages.index(language)
+        except ValueError:
+            raise KeyError(f"the pack has no {language!r} translations") from None
+
+    def lyrics(self, index: int) -> Lyrics:
+        title_at, title_len, artist_at, artist_len, language_at, language_len, first, count = self._song_record(index)
+        paragraphs: List[Tuple[str, ...]] = []
+        current: List[str] = []
+        at = self._lines_at + first * self._line_size
+        for _ in range(count):
+            if self._map[at] & PARAGRAPH_START and current:
+                paragraphs.append(tuple(current))
+                current = []
+            current.append(self._text(*_REF.unpack_from(self._map, at + 1)))
+            at += self._line_size
+        if current:
+            paragraphs.append(tuple(current))
+        return Lyrics(
+            self._text(title_at, title_len),
+            self._text(artist_at, artist_len),
+            tuple(paragraphs),
+            self._text(language_at, language_len) or None,
+        )
+
+    def translations(self, index: int, language: str) -> List[str]:
+        """Every line of a song translated into `language`, in line order."""
+        column = 1 + self._column(language)
+        first, count = self._song_record(index)[6:]
+        at = self._lines_at + first * self._line_size + 1 + column * _REF.size
+        result = []
+        for _ in range(count):
+            result.append(self._text(*_REF.unpack_from(self._map, at)))
+            at += self._line_size
+        return result
+
+
+def write_pack(path: str, languages: Sequence[str], songs: Iterable[Tuple[Lyrics, Dict[str, Sequence[str]]]]):
+    """
+    Write a pack from (lyrics, {language: translated lines}) pairs. Every
+    language in `languages` must have one translation per line. Written to a
+    temporary file first, so a pack is never left half written.
+    """
+    languages = list(languages)
+    for code in languages:
+        if len(code.encode("ascii")) > _LANGUAGE.size:
+            raise PackError(f"language code {code!r} is too long")
+
+    text = bytearray()
+    strings: Dict[str, Tuple[int, int]] = {}
+
+    def ref(s: str) -> Tuple[int, int]:
+        # Each distinct string is stored once; choruses repeat a lot.
+        found = strings.get(s)
+        if found is None:
+            data = s.encode("utf-8")
+            found = strings[s] = (len(text), len(data))
+            text.extend(data)
+        return found
+
+    song_table = bytearray()
+    line_table = bytearray()
+    n_songs = n_lines = 0
+    for lyrics, translated in songs:
+        columns = [translated[code] for code in languages]
+        for code, column in zip(languages, columns):
+            if len(column) != len(lyrics.lines):
+                raise PackError(f"{lyrics.title}: {len(column)} {code} lines for {len(lyrics.lines)} lines")
+        song_table += _SONG.pack(*ref(lyrics.title), *ref(lyrics.artist), *ref(lyrics.language or ""),
+                                 n_lines, len(lyrics.lines))
+        line = 0
+        for paragraph in lyrics.paragraphs:
+            for position, original in enumerate(paragraph):
+                line_table.append(PARAGRAPH_START if position == 0 else 0)
+                line_table += _REF.pack(*ref(original))
+                for column in columns:
+                    line_table += _REF.pack(*ref(column[line]))
+                line += 1
+        n_songs += 1
+        n_lines += len(lyrics.lines)
+
+    languages_at = _HEADER.size
+    songs_at = languages_at + _LANGUAGE.size * len(languages)
+    lines_at = songs_at + len(song_table)
+    text_at = lines_at + len(line_table)
+    header = _HEADER.pack(MAGIC, VERSION, len(languages), n_songs, n_lines, languages_at, songs_at, lines_at, text_at)
+
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(header)
+        for code in languages:
+            f.write(_LANGUAGE.pack(code.encode("ascii")))
+        f.write(song_table)
+        f.write(line_table)
+        f.write(text)
+    os.replace(tmp, path)
+
+
+def _parse_song(value: str) -> Song:
+    title, _, artist = value.rpartition(" - ")
+    if not title:
+        return Song(value.strip())
+    return Song(title.strip(), (artist.strip(),) if artist.strip() else ())
+
+
+def build(path: str, songs: Sequence[Song], languages: Sequence[str], workers: int = BUILD_WORKERS) -> int:
+    """
+    Look up lyrics for `songs` with the genius client, translate them into
+    every language with the translate client, and write the pack. Songs
+    without lyrics are left out. Returns the number of songs in the pack.
+    """
+    import api.genius as genius_client
+    import api.translate as translate_client
+
+    def lookup(song: Song) -> Optional[Lyrics]:
+        try:
+            return genius_client.get_song_lyrics(song.title, song.artist)
+        except Exception as e:
+            print(f"skipping {song.title}: {e}", file=sys.stderr)
+            return None
+
+    entries = []
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        for song, lyrics in zip(songs, executor.map(lookup, songs)):
+            if lyrics is None or not lyrics.has_lyrics:
+                print(f"no lyrics for {song.title}, left out", file=sys.stderr)
+                continue
+            try:
+                translated = {code: list(translate_client.translate_song(lyrics, code).lines) for code in languages}
+            except Exception as e:
+                # Untranslated lines must not end up in the pack as answers.
+                print(f"could not translate {song.title}, left out: {e}", file=sys.stderr)
+                continue
+            entries.append((lyrics, translated))
+            print(f"packed {lyrics.title} ({len(lyrics.lines)} lines)", file=sys.stderr)
+    write_pack(path, languages, entries)
+    return len(entries)
+
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    build_parser = commands.add_parser("build", help="build a pack with the genius and translate clients")
+    build_parser.add_argument("path")
+    build_parser.add_argument("--languages", type=languages.parse_list, required=True,
+                              help="comma separated target languages, e.g. english,sv")
+    build_parser.add_argument("--playlist", help="pack songs from this Spotify playlist")
+    build_parser.add_argument("--limit", type=int, default=None,
+                              help="pack this many random songs of the playlist instead of all of them")
+    build_parser.add_argument("--song", action="append", default=[], type=_parse_song,
+                              help='a song to pack, as "Title - Artist" (repeatable)')
+
+    info_parser = commands.add_parser("info", help="list the songs and languages in a pack")
+    info_parser.add_argument("path")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "info":
+        try:
+            with SongPack(args.path) as pack:
+                print(f"{len(pack)} songs, languages: {', '.join(pack.languages)}")
+                for i in range(len(pack)):
+                    song = pack.song(i)
+                    print(f"{i:>4}  {song.title} - {song.artist}  ({pack.line_count(i)} lines)")
+        except PackError as e:
+            sys.exit(f"error: {e}")
+        return
+
+    songs = list(args.song)
+    if args.playlist:
+        import api.spotify as spotify_client
+        token = spotify_client.get_token()
+        if args.limit:
+            songs += spotify_client.sample_playlist(token, args.playlist, args.limit)
+        else:
+            songs += list(spotify_client.iter_playlist_tracks(token, args.playlist))
+    if not songs:
+        parser.error("nothing to pack: give --playlist and/or --song")
+    count = build(args.path, songs, args.languages)
+    print(f"wrote {count} songs to {args.path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api import langdetect  # noqa: E402
+
+
+class DetectTest(unittest.TestCase):
+    def assertNotConfidentlyWrong(self, text, language):
+        code, confidence = langdetect.detect(text)
+        if code != language:
+            self.assertLess(confidence, langdetect.MIN_CONFIDENCE, f"{text!r} taken for {code}")
+
+    def test_common_languages(self):
+        for text, language in (
+            ("I don't know what to say to you, baby, but I love you all the time", "en"),
+            ("No sé qué decirte, mi amor, pero te quiero con todo el corazón", "es"),
+            ("Je ne sais pas quoi te dire, mais je t'aime de tout mon cœur", "fr"),
+            ("Ich weiß nicht, was ich dir sagen soll, aber ich liebe dich", "de"),
+            ("Я тебя люблю, ты моя мечта, моё счастье", "ru"),
+        ):
+            with self.subTest(text=text):
+                code, confidence = langdetect.detect(text)
+                self.assertEqual(code, language)
+                self.assertGreaterEqual(confidence, langdetect.MIN_CONFIDENCE)
+
+    def test_cyrillic_without_a_marker_letter_is_not_settled(self):
+        # Bulgarian and Ukrainian, with no letter Russian doesn't have.
+        for text, language in (
+            ("Обичам те много, мила моя, ти си моята любов", "bg"),
+            ("Я тебе кохаю дуже сильно, моя кохана", "uk"),
+        ):
+            with self.subTest(text=text):
+                self.assertNotConfidentlyWrong(text, language)
+                self.assertFalse(langdetect.is_language(text, "ru"))
+
+    def test_marker_letters(self):
+        self.assertEqual(langdetect.detect("Я люблю тебе, і ти моя єдина")[0], "uk")
+        self.assertEqual(langdetect.detect("Волим те, ђе си, моја љубави")[0], "sr")
+
+    def test_close_relatives(self):
+        for text, language in (
+            ("T'estimo molt, amor meu, ets la llum de la meva vida", "ca"),
+            ("Quero estar contigo, meu amor, toda a noite ata que chegue o día", "gl"),
+        ):
+            with self.subTest(text=text):
+                self.assertNotConfidentlyWrong(text, language)
+                self.assertFalse(langdetect.is_language(text, "es"))
+                self.assertFalse(langdetect.is_language(text, "pt"))
+
+    def test_languages_without_a_table(self):
+        for text in (
+            "Szeretlek téged, nem tudok nélküled élni, te vagy az életem",
+            "Miluji tě, nemohu bez tebe žít, jsi můj celý svět",
+            "Nakupenda sana, wewe ni moyo wangu milele na milele",
+        ):
+            with self.subTest(text=text):
+                self.assertLess(langdetect.detect(text)[1], langdetect.MIN_CONFIDENCE)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,35 @@
+import io
+import os
+import sys
+import unittest
+from contextlib import redirect_stdout
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main  # noqa: E402
+from game import Game, Work  # noqa: E402
+
+
+def interrupted():
+    raise KeyboardInterrupt
+
+
+class RunInterruptTest(unittest.TestCase):
+    def test_ctrl_c_during_work_exits_cleanly(self):
+        game = Game(warm_playlists=False)
+        game.start()
+        quiz = mock.Mock()
+        game._quiz = quiz
+        game._wait(Work("translate wait", interrupted), lambda result: None)
+        out = io.StringIO()
+        with redirect_stdout(out):
+            main.run(game)
+        self.assertTrue(game.done)
+        self.assertIsNone(game.work)
+        self.assertIn("Interrupted. Exiting.", out.getvalue())
+        quiz.close.assert_called()
+
+
+if __name__ == "__main__":
+    unittest.main()
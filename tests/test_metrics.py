@@ -0,0 +1,39 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api import metrics  # noqa: E402
+
+
+class PrometheusFormatTest(unittest.TestCase):
+    def setUp(self):
+        metrics.reset()
+        metrics.enable("prometheus", at_exit=False)
+        metrics.record("genius.search_song", 0.2)
+        metrics.record("spotify.get_token", 0.03, error=True, nbytes=120)
+        metrics.record_coalesced("translate.request", shared=True)
+
+    def tearDown(self):
+        metrics.disable()
+        metrics.reset()
+
+    def test_each_family_is_contiguous_after_its_type_line(self):
+        families = []
+        for line in metrics.render("prometheus").splitlines():
+            if line.startswith("# TYPE "):
+                family = line.split()[2]
+                self.assertNotIn(family, families, f"{family} declared twice")
+                families.append(family)
+                continue
+            name = line.split("{", 1)[0]
+            self.assertTrue(families, f"sample before any TYPE line: {line}")
+            current = families[-1]
+            self.assertIn(name, (current, current + "_bucket", current + "_sum", current + "_count"),
+                          f"{name} sample inside the {current} family")
+        self.assertEqual(len(families), 6)
+
+
+if __name__ == "__main__":
+    unittest.main()
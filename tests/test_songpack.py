@@ -0,0 +1,62 @@
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api.models import Lyrics  # noqa: E402
+from songpack import PackError, SongPack, write_pack  # noqa: E402
+
+
+def read_everything(path):
+    with SongPack(path) as pack:
+        for i in range(len(pack)):
+            pack.song(i)
+            pack.lyrics(i)
+            pack.translations(i, "en")
+
+
+class SongPackErrorTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp(prefix="lyringo-pack-test-")
+        self.good = os.path.join(self.dir, "good.lyrpack")
+        songs = [
+            (Lyrics.from_text(f"Song {i}", "Artist", "uno dos\ntres\n\ncuatro cinco", "es"),
+             {"en": ["one two", "three", "four five"]})
+            for i in range(3)
+        ]
+        write_pack(self.good, ["en"], songs)
+
+    def write(self, name, data):
+        path = os.path.join(self.dir, name)
+        with open(path, "wb") as f:
+            f.write(data)
+        return path
+
+    def test_good_pack_reads(self):
+        read_everything(self.good)
+
+    def test_missing_file(self):
+        with self.assertRaises(PackError):
+            SongPack(os.path.join(self.dir, "missing.lyrpack"))
+
+    def test_empty_file(self):
+        with self.assertRaises(PackError):
+            SongPack(self.write("empty.lyrpack", b""))
+
+    def test_not_a_pack(self):
+        with self.assertRaises(PackError):
+            SongPack(self.write("other.lyrpack", b"hello, this is not a song pack at all" * 4))
+
+    def test_every_truncation_raises_pack_error(self):
+        with open(self.good, "rb") as f:
+            data = f.read()
+        for size in range(1, len(data)):
+            path = self.write(f"cut{size}.lyrpack", data[:size])
+            with self.subTest(size=size), self.assertRaises(PackError):
+                read_everything(path)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,58 @@
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api import spotify  # noqa: E402
+
+
+class FakeResponse:
+    def __init__(self, status_code):
+        self.status_code = status_code
+
+
+class TokenRefreshTest(unittest.TestCase):
+    def setUp(self):
+        path = os.path.join(tempfile.mkdtemp(prefix="lyringo-spotify-test-"), "token.json")
+        self.provider = spotify.TokenProvider(path)
+        self.issued = iter(["old", "new", "newer"])
+        self.sent = []
+        patches = (
+            mock.patch.object(spotify, "_token_provider", self.provider),
+            mock.patch.object(spotify, "_request_token", lambda: (next(self.issued), 3600)),
+            mock.patch.object(spotify.transport, "get", self.get),
+        )
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def get(self, url, headers=None, params=None):
+        token = headers["Authorization"].split()[1]
+        self.sent.append(token)
+        return FakeResponse(401 if token == "old" else 200)
+
+    def test_refreshed_token_replaces_the_callers_copy(self):
+        token = spotify.get_token()
+        self.assertEqual(token, "old")
+        spotify._api_get(token, "https://api.spotify.com/v1/x")
+        spotify._api_get(token, "https://api.spotify.com/v1/x")
+        spotify._api_get(token, "https://api.spotify.com/v1/x")
+        self.assertEqual(self.sent, ["old", "new", "new", "new"])
+
+    def test_expired_copy_is_refreshed_before_sending(self):
+        token = spotify.get_token()
+        later = spotify.time.time() + 3600
+        with mock.patch.object(spotify.time, "time", return_value=later):
+            spotify._api_get(token, "https://api.spotify.com/v1/x")
+        self.assertEqual(self.sent, ["new"])
+
+    def test_unknown_tokens_are_sent_as_given(self):
+        spotify._api_get("someone-elses", "https://api.spotify.com/v1/x")
+        self.assertEqual(self.sent, ["someone-elses"])
+
+
+if __name__ == "__main__":
+    unittest.main()
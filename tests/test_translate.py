@@ -0,0 +1,20 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api import translate  # noqa: E402
+
+
+class TranslationKeyTest(unittest.TestCase):
+    def test_line_breaks_are_part_of_the_key(self):
+        self.assertNotEqual(translate._translation_key("a\nb", "es"), translate._translation_key("a b", "es"))
+
+    def test_whitespace_within_lines_is_normalized(self):
+        self.assertEqual(translate._translation_key("hola  mundo \nadiós", "es"),
+                         translate._translation_key(" hola mundo\n  adiós", "ES"))
+
+
+if __name__ == "__main__":
+    unittest.main()
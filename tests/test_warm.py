@@ -0,0 +1,61 @@
+import os
+import sys
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import warm  # noqa: E402
+from api.models import Song  # noqa: E402
+
+
+class PipelineErrorTest(unittest.TestCase):
+    def setUp(self):
+        self.out = os.path.join(tempfile.mkdtemp(prefix="lyringo-warm-test-"), "warm.jsonl")
+
+    def run_pipeline(self, pipeline):
+        # Run in a thread so that a hang fails the test instead of blocking it.
+        result = {}
+
+        def target():
+            try:
+                pipeline.run()
+            except Exception as e:
+                result["error"] = e
+
+        thread = threading.Thread(target=target, daemon=True)
+        thread.start()
+        thread.join(10)
+        self.assertFalse(thread.is_alive(), "pipeline did not shut down")
+        return result.get("error")
+
+    def test_playlist_read_failure_stops_every_stage(self):
+        def failing_tracks(token, link):
+            raise RuntimeError("playlist not found")
+            yield
+
+        pipeline = warm.Pipeline("token", "spotify:playlist:x", ["es"], self.out,
+                                 lyrics_workers=3, translate_workers=2)
+        with mock.patch.object(warm.spotify_client, "iter_playlist_tracks", failing_tracks):
+            error = self.run_pipeline(pipeline)
+        self.assertIsInstance(error, RuntimeError)
+        self.assertEqual(str(error), "playlist not found")
+
+    def test_playlist_read_failure_after_some_songs(self):
+        def tracks(token, link):
+            for i in range(20):
+                yield Song(f"song {i}", ("artist",))
+            raise RuntimeError("connection reset")
+
+        pipeline = warm.Pipeline("token", "spotify:playlist:x", ["es"], self.out,
+                                 lyrics_workers=1, translate_workers=1)
+        with mock.patch.object(warm.spotify_client, "iter_playlist_tracks", tracks), \
+                mock.patch.object(warm.genius_client, "get_song_lyrics", return_value=None):
+            error = self.run_pipeline(pipeline)
+        self.assertIsInstance(error, RuntimeError)
+
+
+if __name__ == "__main__":
+    unittest.main()
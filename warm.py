@@ -0,0 +1,314 @@
+"""
+Warm the caches for whole playlists ahead of time, without playing.
+
+Tracks are streamed from Spotify page by page, looked up on Genius by one
+pool of workers and translated into every target language by another. The
+stages are connected by bounded queues, so a slow stage holds the earlier
+ones back instead of piling up work in memory. Lyrics and translations land
+in the regular caches, and every finished song is appended to a JSONL file.
+That file doubles as a journal: run the same command again after a crash
+or Ctrl+C and the finished songs are skipped.
+
+    python warm.py "https://open.spotify.com/playlist/..." --languages english,swedish
+    python warm.py LINK --languages en --lyrics-workers 8 --translate-workers 2 --out warm.jsonl
+
+Throughput per stage (songs/min) and how busy its workers were is printed
+while running and at the end; a stage whose workers are always busy is the
+one to give more workers (or the upstream to be gentle with).
+"""
+import argparse
+import json
+import os
+import queue
+import sys
+import threading
+import time
+from typing import Dict, List, Optional, Set
+
+import api.genius as genius_client
+import api.spotify as spotify_client
+import api.translate as translate_client
+from api import languages, metrics
+from api.cache import cache_dir, normalize_text
+
+DEFAULT_LYRICS_WORKERS = 4
+DEFAULT_TRANSLATE_WORKERS = 2
+# Items waiting between two stages, per worker of the next stage.
+QUEUE_PER_WORKER = 2
+
+_DONE = object()
+
+
+class StageStats:
+    """Counters for one pipeline stage."""
+    __slots__ = ("name", "workers", "done", "skipped", "failed", "busy", "started", "finished", "_lock")
+
+    def __init__(self, name: str, workers: int):
+        self.name = name
+        self.workers = workers
+        self.done = 0
+        self.skipped = 0
+        self.failed = 0
+        self.busy = 0.0
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def add(self, seconds: float, outcome: str = "done"):
+        with self._lock:
+            setattr(self, outcome, getattr(self, outcome) + 1)
+            self.busy += seconds
+
+    def elapsed(self) -> float:
+        if self.started is None:
+            return 0.0
+        return (self.finished or time.perf_counter()) - self.started
+
+    def line(self) -> str:
+        elapsed = self.elapsed()
+        per_minute = self.done / elapsed * 60 if elapsed else 0.0
+        utilization = self.busy / (elapsed * self.workers) * 100 if elapsed else 0.0
+        return (f"{self.name:<10} {self.done:>6} done {self.skipped:>6} skipped {self.failed:>5} failed  "
+                f"{per_minute:>8.1f} songs/min  workers {self.workers:>2} busy {utilization:>5.1f}%")
+
+
+def song_key(title: str, artist: str) -> str:
+    return f"{normalize_text(title).casefold()}\0{normalize_text(artist).casefold()}"
+
+
+def load_journal(path: str) -> Dict[str, Set[str]]:
+    """
+    Songs finished by an earlier run: key -> languages it was translated
+    into. A torn last line (from a crash mid-write) is ignored, and songs
+    that failed are not finished.
+    """
+    finished: Dict[str, Set[str]] = {}
+    if not os.path.exists(path):
+        return finished
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if record.get("status") == "error":
+                continue
+            key = song_key(record.get("title", ""), record.get("artist", ""))
+            finished.setdefault(key, set()).update(record.get("languages") or [])
+    return finished
+
+
+class Pipeline:
+    def __init__(self, token, playlist_link: str, languages: List[str], out_path: str,
+                 lyrics_workers: int = DEFAULT_LYRICS_WORKERS, translate_workers: int = DEFAULT_TRANSLATE_WORKERS,
+                 limit: Optional[int] = None):
+        self.token = token
+        self.playlist_link = playlist_link
+        self.languages = languages
+        self.out_path = out_path
+        self.limit = limit
+        self.finished = load_journal(out_path)
+        self.stats = {
+            "playlist": StageStats("playlist", 1),
+            "lyrics": StageStats("lyrics", lyrics_workers),
+            "translate": StageStats("translate", translate_workers),
+        }
+        self._songs: "queue.Queue" = queue.Queue(maxsize=lyrics_workers * QUEUE_PER_WORKER)
+        self._lyrics: "queue.Queue" = queue.Queue(maxsize=translate_workers * QUEUE_PER_WORKER)
+        self._stop = threading.Event()
+        self._out_lock = threading.Lock()
+        self._out = None
+        self.error: Optional[BaseException] = None
+
+    def _put(self, q: "queue.Queue", item) -> bool:
+        # Blocks while the next stage is behind (backpressure), but gives up
+        # once the pipeline is stopping.
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=0.2)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, q: "queue.Queue"):
+        # Waits for the previous stage, but gives up once the pipeline is
+        # stopping: a failed playlist read may never send the _DONE markers.
+        while not self._stop.is_set():
+            try:
+                return q.get(timeout=0.2)
+            except queue.Empty:
+                continue
+        return _DONE
+
+    def _write(self, record: dict):
+        with self._out_lock:
+            self._out.write(json.dumps(record, ensure_ascii=False) + "\n")
+            self._out.flush()
+
+    def _read_playlist(self):
+        stats = self.stats["playlist"]
+        stats.started = time.perf_counter()
+        seen: Set[str] = set()
+        wanted = set(self.languages)
+        try:
+            last = time.perf_counter()
+            for song in spotify_client.iter_playlist_tracks(self.token, self.playlist_link):
+                now = time.perf_counter()
+                key = song_key(song.title, song.artist)
+                if key in seen or wanted <= self.finished.get(key, set()):
+                    stats.add(now - last, "skipped")
+                else:
+                    seen.add(key)
+                    stats.add(now - last)
+                    if not self._put(self._songs, song):
+                        return
+                    if self.limit and stats.done >= self.limit:
+                        return
+                last = time.perf_counter()
+        except Exception as e:
+            self.error = e
+            self._stop.set()
+        finally:
+            stats.finished = time.perf_counter()
+
+    def _lyrics_worker(self):
+        stats = self.stats["lyrics"]
+        while True:
+            song = self._get(self._songs)
+            if song is _DONE or self._stop.is_set():
+                return
+            start = time.perf_counter()
+            try:
+                lyrics = genius_client.get_song_lyrics(song.title, song.artist)
+            except Exception as e:
+                stats.add(time.perf_counter() - start, "failed")
+                self._write({"title": song.title, "artist": song.artist, "status": "error", "error": str(e)})
+                continue
+            stats.add(time.perf_counter() - start)
+            if lyrics is None or not lyrics.has_lyrics:
+                # Nothing to translate; the negative cache remembers it too.
+                self._write({"title": song.title, "artist": song.artist,
+                             "status": "not_found" if lyrics is None else "no_lyrics",
+                             "languages": self.languages})
+                continue
+            if not self._put(self._lyrics, (song, lyrics)):
+                return
+
+    def _translate_worker(self):
+        stats = self.stats["translate"]
+        while True:
+            item = self._get(self._lyrics)
+            if item is _DONE or self._stop.is_set():
+                return
+            song, lyrics = item
+            start = time.perf_counter()
+            try:
+                translations = {code: list(translate_client.translate_song(lyrics, code).lines)
+                                for code in self.languages}
+            except Exception as e:
+                stats.add(time.perf_counter() - start, "failed")
+                self._write({"title": song.title, "artist": song.artist, "status": "error", "error": str(e)})
+                continue
+            stats.add(time.perf_counter() - start)
+            self._write({
+                "title": song.title, "artist": song.artist, "status": "ok", "languages": self.languages,
+                "lyrics_title": lyrics.title, "lyrics_artist": lyrics.artist, "language": lyrics.language,
+                "lines": list(lyrics.lines), "translations": translations,
+            })
+
+    def _start_stage(self, name, target, count) -> List[threading.Thread]:
+        threads = [threading.Thread(target=target, name=f"lyringo-warm-{name}-{i}", daemon=True) for i in range(count)]
+        for thread in threads:
+            thread.start()
+        return threads
+
+    def _wait(self, threads, progress):
+        for thread in threads:
+            while thread.is_alive():
+                thread.join(progress.interval if progress else 0.5)
+                if progress:
+                    progress.maybe_report()
+
+    def run(self, progress=None):
+        os.makedirs(os.path.dirname(os.path.abspath(self.out_path)), exist_ok=True)
+        with open(self.out_path, "a", encoding="utf-8") as self._out:
+            try:
+                reader = self._start_stage("playlist", self._read_playlist, 1)
+                self.stats["lyrics"].started = self.stats["translate"].started = time.perf_counter()
+                lyrics = self._start_stage("lyrics", self._lyrics_worker, self.stats["lyrics"].workers)
+                translate = self._start_stage("translate", self._translate_worker, self.stats["translate"].workers)
+
+                # Shut the stages down in order: each one finishes its queue first.
+                self._wait(reader, progress)
+                for _ in lyrics:
+                    self._put(self._songs, _DONE)
+                self._wait(lyrics, progress)
+                self.stats["lyrics"].finished = time.perf_counter()
+                for _ in translate:
+                    self._put(self._lyrics, _DONE)
+                self._wait(translate, progress)
+                self.stats["translate"].finished = time.perf_counter()
+            except KeyboardInterrupt:
+                # Everything written so far is in the journal; a rerun resumes.
+                self._stop.set()
+                raise
+        if self.error is not None:
+            raise self.error
+
+    def report(self) -> str:
+        return "\n".join(stats.line() for stats in self.stats.values())
+
+
+class Progress:
+    def __init__(self, pipeline: Pipeline, interval: float):
+        self.pipeline = pipeline
+        self.interval = interval
+        self._last = time.perf_counter()
+
+    def maybe_report(self):
+        if time.perf_counter() - self._last >= self.interval:
+            self._last = time.perf_counter()
+            print(self.pipeline.report() + "\n", file=sys.stderr)
+
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("playlist", help="Spotify playlist link")
+    parser.add_argument("--languages", type=languages.parse_list, required=True,
+                        help="comma separated target languages, e.g. english,sv")
+    parser.add_argument("--out", help="JSONL output and resume journal (default: under the cache dir)")
+    parser.add_argument("--lyrics-workers", type=int, default=DEFAULT_LYRICS_WORKERS)
+    parser.add_argument("--translate-workers", type=int, default=DEFAULT_TRANSLATE_WORKERS)
+    parser.add_argument("--limit", type=int, default=None, help="stop after this many new songs")
+    parser.add_argument("--progress", type=float, default=10.0, help="seconds between progress reports (0: off)")
+    parser.add_argument("--metrics", nargs="?", const="summary", choices=metrics.FORMATS,
+                        help="also report upstream call counts and latencies on exit")
+    args = parser.parse_args(argv)
+
+    if args.metrics:
+        metrics.enable(args.metrics)
+    else:
+        metrics.enable_from_env()
+
+    out = args.out or os.path.join(cache_dir(), "warm", spotify_client.extract_playlist_id(args.playlist) + ".jsonl")
+    pipeline = Pipeline(
+        spotify_client.get_token(), args.playlist, args.languages, out,
+        lyrics_workers=max(1, args.lyrics_workers), translate_workers=max(1, args.translate_workers),
+        limit=args.limit,
+    )
+    if pipeline.finished:
+        print(f"resuming: {len(pipeline.finished)} songs already in {out}", file=sys.stderr)
+    try:
+        pipeline.run(Progress(pipeline, args.progress) if args.progress > 0 else None)
+    except KeyboardInterrupt:
+        print(f"\ninterrupted; run the same command again to resume from {out}", file=sys.stderr)
+        print(pipeline.report(), file=sys.stderr)
+        sys.exit(130)
+    print(pipeline.report())
+    print(f"results in {out}")
+
+
+if __name__ == "__main__":
+    main()